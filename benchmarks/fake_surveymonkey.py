@@ -0,0 +1,232 @@
+"""
+Local stand-in of api.surveymonkey.com used by the benchmarks.
+
+It serves the endpoints used by the XBlock with generated payloads of a configurable size,
+paginated with links.next as the real API, and counts the requests per endpoint.
+"""
+import json
+import re
+import threading
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlencode, urlparse
+
+SURVEY_ID = "100000"
+PREVIOUS_SURVEY_ID = "100001"
+QUESTIONS_PER_SURVEY = 10
+RATE_LIMIT_HEADERS = {
+    "X-Ratelimit-App-Global-Minute-Remaining": "119",
+    "X-Ratelimit-App-Global-Day-Remaining": "9999",
+}
+
+
+def get_student_id(index):
+    return "student-{}".format(index)
+
+
+class FakeSurveyMonkeyData(object):
+    """
+    Generated SurveyMonkey data: surveys, collectors, details and bulk responses.
+    """
+    def __init__(self, surveys=500, collectors=150, responses=5000):
+        self.surveys = [
+            {"id": str(int(SURVEY_ID) + index), "title": "Survey {}".format(index), "nickname": ""}
+            for index in range(surveys)
+        ]
+        self.collectors = [
+            {"id": str(200000 + index), "name": "Collector {}".format(index), "type": "email", "url": ""}
+            for index in range(collectors - 1)
+        ]
+        self.collectors.append({
+            "id": "299999",
+            "name": "Web link",
+            "type": "weblink",
+            "url": "https://www.surveymonkey.com/r/BENCHMARK",
+        })
+        self.questions = [
+            {
+                "id": str(300000 + index),
+                "headings": [{"heading": "Question {}".format(index)}],
+                "family": "open_ended",
+            }
+            for index in range(QUESTIONS_PER_SURVEY)
+        ]
+        self.responses = [
+            {
+                "id": str(400000 + index),
+                "date_modified": "2021-01-01T00:{:02d}:{:02d}+00:00".format(index // 60 % 60, index % 60),
+                "custom_variables": {"uid": get_student_id(index)},
+                "pages": [{
+                    "id": "500000",
+                    "questions": [
+                        {
+                            "id": question["id"],
+                            "heading": question["headings"][0]["heading"],
+                            "answers": [{"simple_text": "Answer {} of {}".format(question["id"], index)}],
+                        }
+                        for question in self.questions
+                    ],
+                }],
+            }
+            for index in range(responses)
+        ]
+        # (route name, page number) of the pages answered with a 500 error.
+        self.failing_pages = set()
+
+    def get_details(self, survey_id):
+        return {
+            "id": survey_id,
+            "title": "Survey",
+            "pages": [{"id": "500000", "questions": self.questions}],
+        }
+
+
+class FakeSurveyMonkeyHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the fake SurveyMonkey API.
+    """
+    routes = (
+        ("POST", re.compile(r"^/oauth/token$"), "token"),
+        ("GET", re.compile(r"^/v3/surveys$"), "surveys"),
+        ("GET", re.compile(r"^/v3/surveys/(\w+)/collectors$"), "collectors"),
+        ("GET", re.compile(r"^/v3/surveys/(\w+)/details$"), "details"),
+        ("GET", re.compile(r"^/v3/surveys/(\w+)/responses/bulk$"), "responses"),
+        ("GET", re.compile(r"^/v3/collectors/(\w+)/responses/bulk$"), "responses"),
+        ("PATCH", re.compile(r"^/v3/surveys/(\w+)/pages/(\w+)/questions/(\w+)$"), "patch_question"),
+    )
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+
+        for route_method, pattern, name in self.routes:
+            match = pattern.match(url.path)
+
+            if route_method == method and match:
+                self.server.requests[name] += 1
+                query = parse_qs(url.query)
+
+                if (name, int(query.get("page", ["1"])[0])) in self.server.data.failing_pages:
+                    return self._send(500, {"error": "internal error"})
+
+                body = getattr(self, "_{}".format(name))(query, *match.groups())
+                return self._send(200, body)
+
+        return self._send(404, {"error": "not found"})
+
+    def _send(self, status_code, body):
+        content = json.dumps(body).encode("utf-8")
+        length = int(self.headers.get("Content-Length") or 0)
+
+        if length:
+            self.rfile.read(length)
+
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+
+        for header, value in RATE_LIMIT_HEADERS.items():
+            self.send_header(header, value)
+
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _paginate(self, query, items):
+        per_page = int(query.get("per_page", ["50"])[0])
+        page = int(query.get("page", ["1"])[0])
+        start = (page - 1) * per_page
+        links = {}
+
+        if start + per_page < len(items):
+            next_query = {key: values[0] for key, values in query.items()}
+            next_query.update(page=page + 1, per_page=per_page)
+            links["next"] = "{}{}?{}".format(self.server.base_url, urlparse(self.path).path, urlencode(next_query))
+
+        return {
+            "data": items[start:start + per_page],
+            "per_page": per_page,
+            "page": page,
+            "total": len(items),
+            "links": links,
+        }
+
+    def _token(self, query):
+        return {"access_token": "benchmark-token", "token_type": "bearer"}
+
+    def _surveys(self, query):
+        return self._paginate(query, self.server.data.surveys)
+
+    def _collectors(self, query, survey_id):
+        return self._paginate(query, self.server.data.collectors)
+
+    def _details(self, query, survey_id):
+        return self.server.data.get_details(survey_id)
+
+    def _responses(self, query, object_id):
+        responses = self.server.data.responses
+        start_modified_at = query.get("start_modified_at", [None])[0]
+
+        if start_modified_at:
+            responses = [response for response in responses if response["date_modified"][:19] >= start_modified_at]
+
+        return self._paginate(query, responses)
+
+    def _patch_question(self, query, survey_id, page_id, question_id):
+        return {"id": question_id}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeSurveyMonkeyServer(object):
+    """
+    Runs the fake SurveyMonkey API in a background thread:
+
+        with FakeSurveyMonkeyServer(FakeSurveyMonkeyData()) as server:
+            requests.get("{}/v3/surveys".format(server.base_url))
+    """
+    def __init__(self, data):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSurveyMonkeyHandler)
+        self.server.data = data
+        self.server.requests = Counter()
+        self.server.base_url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def data(self):
+        return self.server.data
+
+    @data.setter
+    def data(self, data):
+        self.server.data = data
+
+    @property
+    def base_url(self):
+        return self.server.base_url
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
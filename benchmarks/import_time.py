@@ -0,0 +1,126 @@
+"""
+Measures the time spent importing the surveymonkey XBlock with python -X importtime.
+
+Run it from the Python environment of edx-platform, with the Django settings of the LMS:
+
+    DJANGO_SETTINGS_MODULE=lms.envs.test python benchmarks/import_time.py --runs 5
+
+The Django setup is imported before the measure, so only the modules loaded by the
+XBlock are reported. Use --modules to check that heavy modules are not imported.
+
+It exits with an error if the XBlock imports any of the --forbidden modules, pkg_resources
+by default. They are blocked in a separate import, so they are detected even if the Django
+setup already imported them.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+DEFAULT_WATCHED_MODULES = (
+    "pkg_resources",
+    "requests_oauthlib",
+    "openedx.core.lib.courses",
+    "xmodule.modulestore.django",
+)
+
+DEFAULT_FORBIDDEN_MODULES = (
+    "pkg_resources",
+)
+SETUP_STATEMENT = "import django; django.setup()"
+IMPORT_MARKER = "surveymonkey-import-start"
+
+
+def measure_import(python):
+    """
+    Returns a dict with the cumulative import time in microseconds of every module
+    imported by the XBlock.
+    """
+    statement = "{}; import sys; sys.stderr.write('{}\\n'); import surveymonkey".format(SETUP_STATEMENT, IMPORT_MARKER)
+    output = subprocess.run(
+        [python, "-X", "importtime", "-c", statement],
+        stderr=subprocess.PIPE,
+        check=True,
+        env=os.environ.copy(),
+        universal_newlines=True,
+    ).stderr
+    # The modules imported by the Django setup are reported before the marker.
+    output = output.split(IMPORT_MARKER, 1)[-1]
+    timings = {}
+
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, module = line[len("import time:"):].split("|")
+        timings[module.strip()] = int(cumulative)
+
+    return timings
+
+
+def get_forbidden_imports(python, modules):
+    """
+    Returns the modules of the given list that are imported by the XBlock.
+
+    Every module is made unimportable after the Django setup, so the XBlock import fails if it
+    imports the module, even when the module was already imported by the setup.
+    """
+    imported = []
+
+    for module in modules:
+        statement = "{}; import sys; sys.modules[{!r}] = None; import surveymonkey".format(SETUP_STATEMENT, module)
+        process = subprocess.run(
+            [python, "-c", statement],
+            stderr=subprocess.PIPE,
+            env=os.environ.copy(),
+            universal_newlines=True,
+        )
+
+        if process.returncode:
+            imported.append(module)
+
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of measured imports.")
+    parser.add_argument("--python", default=sys.executable, help="Python interpreter to measure.")
+    parser.add_argument("--modules", nargs="*", default=DEFAULT_WATCHED_MODULES, help="Modules to report.")
+    parser.add_argument(
+        "--forbidden",
+        nargs="*",
+        default=DEFAULT_FORBIDDEN_MODULES,
+        help="Modules that the XBlock must not import.",
+    )
+    args = parser.parse_args()
+
+    totals = []
+    watched = {module: False for module in args.modules}
+
+    for _ in range(args.runs):
+        timings = measure_import(args.python)
+        totals.append(timings.get("surveymonkey", 0))
+
+        for module in watched:
+            watched[module] = watched[module] or module in timings
+
+    totals.sort()
+    print("surveymonkey import time over {} runs".format(args.runs))
+    print("  min    {:>8.1f} ms".format(totals[0] / 1000.0))
+    print("  median {:>8.1f} ms".format(totals[len(totals) // 2] / 1000.0))
+    print("  max    {:>8.1f} ms".format(totals[-1] / 1000.0))
+    print("Modules imported by the XBlock:")
+
+    for module, imported in watched.items():
+        print("  {:<30} {}".format(module, "yes" if imported else "no"))
+
+    forbidden_imports = get_forbidden_imports(args.python, args.forbidden)
+
+    if forbidden_imports:
+        print("The XBlock imports forbidden modules: {}".format(", ".join(forbidden_imports)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Benchmarks of the surveymonkey XBlock hot paths against a local fake SurveyMonkey API.
+
+The XBlock runs with an in-memory Django cache and an in-memory stand-in of the submissions
+API, so only the XBlock, Django, XBlock and requests packages need to be installed:
+
+    python benchmarks/run_benchmarks.py --responses 5000 --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json
+
+It measures:
+    - student_view latency of a trackable block that recaps a previous survey.
+    - validate_field_data time, with a cold and a warm cache.
+    - get_user_previous_survey_responses time and peak memory, with a cold and a warm cache.
+    - OAuth token requests for many ApiSurveyMonkey instances.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_surveymonkey import (  # noqa: E402
+    PREVIOUS_SURVEY_ID,
+    QUESTIONS_PER_SURVEY,
+    SURVEY_ID,
+    FakeSurveyMonkeyData,
+    FakeSurveyMonkeyServer,
+    get_student_id,
+)
+
+
+def setup_django():
+    """
+    Configures Django with an in-memory cache and installs the submissions stand-in.
+    """
+    import django
+    from django.conf import settings
+
+    # The fake API is served over http.
+    os.environ.setdefault("OAUTHLIB_INSECURE_TRANSPORT", "1")
+    settings.configure(
+        LMS_BASE="localhost:18000",
+        INSTALLED_APPS=[],
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "OPTIONS": {"MAX_ENTRIES": 1000000},
+            },
+        },
+        TEMPLATES=[{"BACKEND": "django.template.backends.django.DjangoTemplates"}],
+        USE_I18N=True,
+        SURVEYMONKEY_REQUESTS_PER_MINUTE=1000000,
+    )
+    django.setup()
+    install_submissions_stub()
+
+
+class SubmissionsStub(object):
+    """
+    In-memory stand-in of the submissions API and of the Submission model queries used by the XBlock.
+    """
+    ACTIVE = "A"
+
+    def __init__(self):
+        self.student_items = []
+        self.queries = 0
+        self.objects = self
+
+    def create_submission(self, student_item, answer):
+        self.student_items.append(dict(student_item))
+        return {"uuid": str(len(self.student_items)), "answer": answer}
+
+    def get_submissions(self, student_item, limit=None):
+        self.queries += 1
+        return [item for item in self.student_items if item == student_item][:limit]
+
+    def filter(self, status=None, **lookups):
+        self.queries += 1
+        items = self.student_items
+
+        for lookup, value in lookups.items():
+            field = lookup.replace("student_item__", "")
+
+            if field.endswith("__in"):
+                values = set(value)
+                items = [item for item in items if item[field[:-len("__in")]] in values]
+            else:
+                items = [item for item in items if item[field] == value]
+
+        def values_list(*fields, **kwargs):
+            rows = [tuple(item[field.replace("student_item__", "")] for field in fields) for item in items]
+            return [row[0] for row in rows] if kwargs.get("flat") else rows
+
+        return types.SimpleNamespace(values_list=values_list)
+
+
+SUBMISSIONS = SubmissionsStub()
+
+
+def install_submissions_stub():
+    submissions = types.ModuleType("submissions")
+    submissions.api = types.ModuleType("submissions.api")
+    submissions.models = types.ModuleType("submissions.models")
+    submissions.api.create_submission = SUBMISSIONS.create_submission
+    submissions.api.get_submissions = SUBMISSIONS.get_submissions
+    submissions.models.Submission = SUBMISSIONS
+    sys.modules.update({
+        "submissions": submissions,
+        "submissions.api": submissions.api,
+        "submissions.models": submissions.models,
+    })
+
+
+def point_to_fake_api(base_url):
+    """
+    Sends the requests of the XBlock to the fake API.
+    """
+    from surveymonkey import api_session, api_surveymonkey, api_surveymonkey_async
+
+    for module in (api_session, api_surveymonkey, api_surveymonkey_async):
+        module.API_BASE = base_url
+
+
+def reset_state():
+    """
+    Clears the cache and the process-wide clients, as in a new worker process.
+    """
+    from django.core.cache import cache
+    from surveymonkey import api_session
+
+    cache.clear()
+    api_session._CLIENTS.clear()
+
+
+def build_block(student_index, **fields):
+    """
+    Returns a trackable surveymonkey block seen by the given student.
+    """
+    from opaque_keys.edx.locator import CourseLocator
+    from xblock.field_data import DictFieldData
+    from xblock.fields import ScopeIds
+    from surveymonkey import SurveyMonkeyXBlock
+
+    course_key = CourseLocator("edX", "Benchmark", "2021")
+    usage_key = course_key.make_usage_key("surveymonkey", "benchmark")
+    field_values = {
+        "client_id": "benchmark-client",
+        "client_secret": "benchmark-secret",
+        "survey_name": "Survey 0",
+        "survey_id": SURVEY_ID,
+        "survey_link": "https://www.surveymonkey.com/r/BENCHMARK",
+        "trackable": True,
+        "overwrite_survey_questions": True,
+        "previous_survey_name": "Survey 1",
+        "previous_survey_id": PREVIOUS_SURVEY_ID,
+        "overwritten_question_headings": "\n".join(
+            "Your previous answer was {{Question {}}}".format(index) for index in range(QUESTIONS_PER_SURVEY)
+        ),
+    }
+    field_values.update(fields)
+    runtime = mock.Mock(anonymous_student_id=get_student_id(student_index))
+    block = SurveyMonkeyXBlock(
+        runtime,
+        DictFieldData(field_values),
+        ScopeIds("user", "surveymonkey", usage_key, usage_key),
+    )
+    block.location = usage_key
+    block.course_id = course_key
+    block.xmodule_runtime = types.SimpleNamespace()
+    return block
+
+
+def summarize(timings):
+    """
+    Returns the median, p95 and max of the timings in milliseconds.
+    """
+    timings = sorted(timing * 1000 for timing in timings)
+    return {
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "max_ms": timings[-1],
+    }
+
+
+def timed_call(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def benchmark_student_view(server, renders):
+    reset_state()
+    requests_before = sum(server.requests.values())
+    cold = timed_call(build_block(0).student_view)
+    cold_requests = sum(server.requests.values()) - requests_before
+    requests_before = sum(server.requests.values())
+    queries_before = SUBMISSIONS.queries
+    warm = [timed_call(build_block(index).student_view) for index in range(1, renders + 1)]
+
+    return dict(
+        summarize(warm),
+        cold_ms=cold * 1000,
+        cold_api_requests=cold_requests,
+        api_requests_per_render=(sum(server.requests.values()) - requests_before) / float(renders),
+        submission_queries_per_render=(SUBMISSIONS.queries - queries_before) / float(renders),
+    )
+
+
+def benchmark_validation(server, runs):
+    from xblock.validation import Validation
+
+    block = build_block(0)
+    data = types.SimpleNamespace(
+        client_id=block.client_id,
+        client_secret=block.client_secret,
+        survey_name=block.survey_name,
+        previous_survey_name=block.previous_survey_name,
+        overwrite_survey_questions=True,
+        surveymonkey_api_cache_duration=block.surveymonkey_api_cache_duration,
+    )
+
+    reset_state()
+    cold = timed_call(block.validate_field_data, Validation(block.location), data)
+    warm = [timed_call(block.validate_field_data, Validation(block.location), data) for _ in range(runs)]
+
+    return dict(summarize(warm), cold_ms=cold * 1000)
+
+
+def benchmark_previous_responses(server, lookups, respondents):
+    reset_state()
+    tracemalloc.start()
+    cold = timed_call(build_block(respondents - 1).get_user_previous_survey_responses)
+    cold_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    step = max(respondents // lookups, 1)
+    warm = [
+        timed_call(build_block(index).get_user_previous_survey_responses)
+        for index in range(0, respondents, step)
+    ]
+    warm_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return dict(
+        summarize(warm),
+        cold_ms=cold * 1000,
+        cold_peak_memory_kb=cold_peak / 1024.0,
+        warm_peak_memory_kb=warm_peak / 1024.0,
+    )
+
+
+def benchmark_token_churn(server, instances):
+    from surveymonkey.api_surveymonkey import ApiSurveyMonkey
+
+    reset_state()
+    tokens_before = server.requests["token"]
+
+    for _ in range(instances):
+        ApiSurveyMonkey("benchmark-client", "benchmark-secret", 86400)
+
+    return {
+        "instances": instances,
+        "token_requests": server.requests["token"] - tokens_before,
+    }
+
+
+def compare(results, baseline):
+    """
+    Prints the relative change of every numeric result against the baseline.
+    """
+    print("\nChange against the baseline:")
+
+    for name, metrics in sorted(results.items()):
+        for metric, value in sorted(metrics.items()):
+            previous = baseline.get(name, {}).get(metric)
+
+            if not previous:
+                continue
+
+            print("  {:<30} {:<30} {:>+8.1f}%".format(name, metric, (value - previous) * 100.0 / previous))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--surveys", type=int, default=500, help="Surveys of the fake account.")
+    parser.add_argument("--collectors", type=int, default=150, help="Collectors of every survey.")
+    parser.add_argument("--responses", type=int, default=5000, help="Bulk responses of every survey.")
+    parser.add_argument("--renders", type=int, default=200, help="Measured student_view renders.")
+    parser.add_argument("--output", help="File to write the results as JSON, e.g. to use it as baseline.")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with.")
+    args = parser.parse_args()
+
+    setup_django()
+    data = FakeSurveyMonkeyData(args.surveys, args.collectors, args.responses)
+
+    with FakeSurveyMonkeyServer(data) as server:
+        point_to_fake_api(server.base_url)
+        results = {
+            "student_view": benchmark_student_view(server, args.renders),
+            "validate_field_data": benchmark_validation(server, args.renders),
+            "previous_survey_responses": benchmark_previous_responses(server, args.renders, args.responses),
+            "token_churn": benchmark_token_churn(server, args.renders),
+        }
+
+    for name, metrics in results.items():
+        print(name)
+
+        for metric, value in metrics.items():
+            print("  {:<30} {:>12.3f}".format(metric, value))
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -29,10 +29,16 @@ setup(
     license='UNKNOWN',          # TODO: choose a license: 'AGPL v3' and 'Apache 2.0' are popular.
     packages=[
         'surveymonkey',
+        'surveymonkey.management',
+        'surveymonkey.management.commands',
     ],
     install_requires=[
         'XBlock',
     ],
+    extras_require={
+        'async': ['httpx'],
+        'stream': ['ijson'],
+    },
     entry_points={
         'xblock.v1': [
             'surveymonkey = surveymonkey:SurveyMonkeyXBlock',
@@ -0,0 +1,359 @@
+"""
+Scheduler of the requests sent to the surveymonkey API_BASE.
+
+It keeps the requests under the SurveyMonkey rate limits, retries the transient errors
+with a jittered exponential backoff and stops calling the API while it is degraded, so
+the student views fail fast instead of waiting for the timeouts.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import requests
+
+from django.conf import settings
+
+from .metrics import get_endpoint, get_metrics
+
+LOG = logging.getLogger(__name__)
+DEFAULT_REQUEST_TIMEOUT = (3.05, 10)
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 8
+# SurveyMonkey allows 120 requests per minute to the applications by default.
+DEFAULT_REQUESTS_PER_MINUTE = 120
+# Maximum seconds to wait for the rate limiter before giving up the request.
+DEFAULT_MAX_RATE_LIMIT_WAIT = 2
+DEFAULT_CIRCUIT_FAILURE_THRESHOLD = 5
+DEFAULT_CIRCUIT_RESET_TIMEOUT = 30
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+MINUTE_REMAINING_HEADER = "X-Ratelimit-App-Global-Minute-Remaining"
+MINUTE_RESET_HEADER = "X-Ratelimit-App-Global-Minute-Reset"
+DAY_REMAINING_HEADER = "X-Ratelimit-App-Global-Day-Remaining"
+DAY_RESET_HEADER = "X-Ratelimit-App-Global-Day-Reset"
+
+
+def build_error_response(url, status_code):
+    """
+    Returns a requests.Response for a request that was not sent, so the callers can handle
+    it as any other unsuccessful response.
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = url
+    response._content = b"{}"
+    response._content_consumed = True
+    return response
+
+
+def _get_int_header(response, header):
+    try:
+        return int(response.headers.get(header))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter synchronized with the SurveyMonkey rate limit headers.
+    """
+    def __init__(self, requests_per_minute):
+        self.capacity = float(requests_per_minute)
+        self.fill_rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated_at = time.time()
+        self.blocked_until = 0
+        self.minute_remaining = None
+        self.day_remaining = None
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.fill_rate)
+        self.updated_at = now
+
+    def reserve(self, max_wait):
+        """
+        Takes a token and returns the seconds to wait before using it.
+
+        Returns:
+            Float: Seconds to wait, None if the token is not available in max_wait seconds.
+        """
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            wait = max(self.blocked_until - now, (1 - self.tokens) / self.fill_rate, 0)
+
+            if wait > max_wait:
+                return None
+
+            # The token is reserved now, so concurrent callers wait for the next ones.
+            self.tokens -= 1
+
+        return wait
+
+    def acquire(self, max_wait):
+        """
+        Takes a token, waiting up to max_wait seconds for it.
+
+        Returns:
+            Boolean: False if the token is not available in max_wait seconds.
+        """
+        wait = self.reserve(max_wait)
+
+        if wait is None:
+            return False
+
+        if wait:
+            time.sleep(wait)
+
+        return True
+
+    def block(self, seconds):
+        """
+        Stops handing out tokens for the given seconds, e.g. after SurveyMonkey answered with a 429.
+        """
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+    def get_blocked_time(self):
+        """
+        Returns the seconds until the bucket hands out tokens again after being blocked.
+        """
+        with self._lock:
+            return max(self.blocked_until - time.time(), 0)
+
+    def update(self, response):
+        """
+        Adjusts the bucket to the remaining requests reported by SurveyMonkey.
+        """
+        minute_remaining = _get_int_header(response, MINUTE_REMAINING_HEADER)
+        day_remaining = _get_int_header(response, DAY_REMAINING_HEADER)
+        metrics = get_metrics()
+
+        if minute_remaining is not None:
+            metrics.gauge("surveymonkey.api.ratelimit.minute_remaining", minute_remaining)
+
+        if day_remaining is not None:
+            metrics.gauge("surveymonkey.api.ratelimit.day_remaining", day_remaining)
+
+        with self._lock:
+            now = time.time()
+
+            if minute_remaining is not None:
+                self.minute_remaining = minute_remaining
+                self._refill(now)
+                self.tokens = min(self.tokens, minute_remaining)
+
+                if minute_remaining <= 0:
+                    reset = _get_int_header(response, MINUTE_RESET_HEADER) or 60
+                    self.blocked_until = max(self.blocked_until, now + reset)
+
+            if day_remaining is not None:
+                self.day_remaining = day_remaining
+
+                if day_remaining <= 0:
+                    reset = _get_int_header(response, DAY_RESET_HEADER) or 60 * 60
+                    self.blocked_until = max(self.blocked_until, now + reset)
+                    LOG.error("The SurveyMonkey daily API quota is exhausted, resets in %s seconds", reset)
+
+
+class CircuitBreaker(object):
+    """
+    Stops the requests after several consecutive failures and lets one request through
+    after reset_timeout seconds to check if the API recovered.
+    """
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # Half open, the next failure opens the circuit again.
+                self.opened_at = time.time()
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    LOG.error("Too many SurveyMonkey API errors, the requests are stopped for %s seconds", self.reset_timeout)
+
+                self.opened_at = time.time()
+
+
+class RequestScheduler(object):
+    """
+    Sends the requests of a SurveyMonkey client through the rate limiter and the circuit breaker.
+    """
+    def __init__(self):
+        self.timeout = getattr(settings, "SURVEYMONKEY_REQUEST_TIMEOUT", DEFAULT_REQUEST_TIMEOUT)
+        self.max_retries = getattr(settings, "SURVEYMONKEY_MAX_RETRIES", DEFAULT_MAX_RETRIES)
+        self.max_rate_limit_wait = getattr(settings, "SURVEYMONKEY_MAX_RATE_LIMIT_WAIT", DEFAULT_MAX_RATE_LIMIT_WAIT)
+        self.rate_limiter = TokenBucket(
+            getattr(settings, "SURVEYMONKEY_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE),
+        )
+        self.circuit_breaker = CircuitBreaker(
+            getattr(settings, "SURVEYMONKEY_CIRCUIT_FAILURE_THRESHOLD", DEFAULT_CIRCUIT_FAILURE_THRESHOLD),
+            getattr(settings, "SURVEYMONKEY_CIRCUIT_RESET_TIMEOUT", DEFAULT_CIRCUIT_RESET_TIMEOUT),
+        )
+
+    @staticmethod
+    def get_backoff(attempt, retry_after=None):
+        """
+        Returns the seconds to wait before the given retry attempt, with full jitter.
+        """
+        if retry_after:
+            return min(retry_after, DEFAULT_BACKOFF_MAX)
+
+        return random.uniform(0, min(DEFAULT_BACKOFF_MAX, DEFAULT_BACKOFF_BASE * 2 ** attempt))
+
+    def _before_request(self, method, url):
+        """
+        Returns an error response if the request must not be sent, or the seconds to wait before sending it.
+        """
+        if not self.circuit_breaker.allow_request():
+            LOG.warning("Surveymonkey circuit open, skipping %s %s", method.upper(), url)
+            get_metrics().increment("surveymonkey.api.request.skipped", tags={"reason": "circuit_open"})
+            return build_error_response(url, 503)
+
+        wait = self.rate_limiter.reserve(self.max_rate_limit_wait)
+
+        if wait is None:
+            LOG.warning("Surveymonkey rate limit reached, skipping %s %s", method.upper(), url)
+            get_metrics().increment("surveymonkey.api.request.skipped", tags={"reason": "rate_limited"})
+            return build_error_response(url, 429)
+
+        return wait
+
+    def _after_request(self, method, url, response, attempt, start):
+        """
+        Records the response and returns the seconds to wait before retrying it, or None if it is final.
+        """
+        get_metrics().timing(
+            "surveymonkey.api.request.duration",
+            (time.time() - start) * 1000,
+            tags={
+                "method": method.upper(),
+                "endpoint": get_endpoint(url),
+                "status_code": response.status_code,
+            },
+        )
+
+        if response.status_code not in RETRY_STATUS_CODES:
+            self.circuit_breaker.record_success()
+            return None
+
+        # Sustained 429s also open the circuit, the API is not usable until the limit resets.
+        self.circuit_breaker.record_failure()
+        retry_after = _get_int_header(response, "Retry-After")
+
+        if response.status_code == 429 and retry_after:
+            self.rate_limiter.block(retry_after)
+
+        if attempt >= self.max_retries:
+            return None
+
+        backoff = self.get_backoff(attempt, retry_after)
+
+        if max(backoff, self.rate_limiter.get_blocked_time()) > self.max_rate_limit_wait:
+            # Waiting longer would hold the student view, the caller gets the error response instead.
+            get_metrics().increment("surveymonkey.api.request.skipped", tags={"reason": "rate_limited"})
+            return None
+
+        get_metrics().increment("surveymonkey.api.request.retried", tags={"status_code": response.status_code})
+
+        return backoff
+
+    def request(self, session, method, url, **kwargs):
+        """
+        Sends the request with the session and returns the response.
+
+        A response with the 503 status code is returned without calling the API when the
+        circuit is open, and with the 429 status code when the rate limit is reached.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+
+        while True:
+            wait = self._before_request(method, url)
+
+            if isinstance(wait, requests.Response):
+                return wait
+
+            if wait:
+                time.sleep(wait)
+
+            start = time.time()
+
+            try:
+                response = session.request(method, url, **kwargs)
+            except requests.RequestException as error:
+                LOG.warning("Surveymonkey %s request error %s %s", method.upper(), error, url)
+                response = build_error_response(url, 503)
+            else:
+                self.rate_limiter.update(response)
+
+            backoff = self._after_request(method, url, response, attempt, start)
+
+            if backoff is None:
+                return response
+
+            # Releases the connection of a streamed response before retrying.
+            response.close()
+            time.sleep(backoff)
+            attempt += 1
+
+    async def request_async(self, async_client, method, url, **kwargs):
+        """
+        Sends the request with an httpx.AsyncClient and returns the response, the waits
+        of the rate limiter and of the retries do not block the event loop.
+        """
+        import httpx
+
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+
+        while True:
+            wait = self._before_request(method, url)
+
+            if isinstance(wait, requests.Response):
+                return wait
+
+            if wait:
+                await asyncio.sleep(wait)
+
+            start = time.time()
+
+            try:
+                response = await async_client.request(method, url, **kwargs)
+            except httpx.HTTPError as error:
+                LOG.warning("Surveymonkey %s request error %s %s", method.upper(), error, url)
+                response = build_error_response(url, 503)
+            else:
+                self.rate_limiter.update(response)
+
+            backoff = self._after_request(method, url, response, attempt, start)
+
+            if backoff is None:
+                return response
+
+            await asyncio.sleep(backoff)
+            attempt += 1
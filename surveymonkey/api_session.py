@@ -0,0 +1,248 @@
+"""
+Process-wide registry of the HTTP sessions and OAuth tokens used to call the surveymonkey API_BASE.
+
+The ApiSurveyMonkey instances are created per block and per request, this registry allows them
+to share one connection pool and one access token per client id.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import requests
+
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from .api_scheduler import RequestScheduler
+
+LOG = logging.getLogger(__name__)
+API_BASE = "https://api.surveymonkey.com"
+SURVEY_MONKEY_TOKEN_TAG = "api_survey_monkey"
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 20
+# Seconds subtracted from the token expires_in, so it is refreshed before it is rejected.
+TOKEN_EXPIRY_MARGIN = 60
+TOKEN_LOCK_TIMEOUT = 30
+TOKEN_FETCH_WAIT = 5
+TOKEN_POLL_INTERVAL = 0.1
+
+
+class SurveyMonkeyClient(object):
+    """
+    Pooled session and access token of a SurveyMonkey application.
+    """
+    def __init__(self, client_id, client_secret):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.session = self._build_session()
+        self.scheduler = RequestScheduler()
+        self._token_lock = threading.Lock()
+        self._headers = None
+        self._expires_at = None
+
+    @staticmethod
+    def _build_session():
+        """
+        Returns a keep-alive session with a connection pool sized for concurrent workers.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=getattr(settings, "SURVEYMONKEY_POOL_CONNECTIONS", DEFAULT_POOL_CONNECTIONS),
+            pool_maxsize=getattr(settings, "SURVEYMONKEY_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE),
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def token_cache_key(self):
+        return "{}-{}-{}-{}".format(SURVEY_MONKEY_TOKEN_TAG, "token", self.client_id, self.client_secret)
+
+    def _is_token_valid(self):
+        return self._headers is not None and (self._expires_at is None or self._expires_at > time.time())
+
+    def get_headers(self, default_duration=None):
+        """
+        Returns the authorization headers, fetching a new access token only when it is needed.
+
+        The token is looked up in the process, then in the shared cache and finally requested
+        to SurveyMonkey. Only one thread of the process requests a new token at a time, the
+        others wait for it and reuse it.
+
+        Args:
+            default_duration: Seconds to keep the token when SurveyMonkey does not return expires_in.
+        """
+        if self._is_token_valid():
+            return self._headers
+
+        with self._token_lock:
+            if self._is_token_valid():
+                return self._headers
+
+            token_data = cache.get(self.token_cache_key)
+
+            if not token_data:
+                token_data = self._fetch_token(default_duration)
+
+            self._set_token(token_data)
+
+        return self._headers
+
+    def _fetch_token(self, default_duration):
+        """
+        Requests a new access token and stores it in the shared cache.
+
+        Only one worker of all the processes requests the token, the others wait for it up to
+        TOKEN_FETCH_WAIT seconds before requesting their own.
+        """
+        lock_key = "{}-{}".format(self.token_cache_key, "lock")
+        locked = cache.add(lock_key, True, TOKEN_LOCK_TIMEOUT)
+
+        if not locked:
+            deadline = time.time() + TOKEN_FETCH_WAIT
+
+            while time.time() < deadline:
+                time.sleep(TOKEN_POLL_INTERVAL)
+                token_data = cache.get(self.token_cache_key)
+
+                if token_data:
+                    return token_data
+
+        try:
+            return self._request_token(default_duration)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+    def _request_token(self, default_duration):
+        """
+        Requests a new access token to SurveyMonkey and stores it in the shared cache.
+        """
+        # requests_oauthlib is only needed to request the tokens, so it is not imported with the XBlock.
+        from oauthlib.oauth2 import BackendApplicationClient
+        from requests_oauthlib import OAuth2Session
+
+        client = BackendApplicationClient(client_id=self.client_id)
+        oauth = OAuth2Session(client=client)
+        authenticate_url = "{}/{}".format(API_BASE, "oauth/token")
+
+        token = oauth.fetch_token(
+            token_url=authenticate_url,
+            client_id=self.client_id,
+            client_secret=self.client_secret
+        )
+        LOG.info("Surveymonkey access token requested for the client %s", self.client_id)
+
+        expires_in = token.get("expires_in")
+        timeout = max(int(expires_in) - TOKEN_EXPIRY_MARGIN, 1) if expires_in else default_duration or None
+        token_data = {
+            "headers": {
+                "Authorization": "{} {}".format("Bearer", token.get("access_token")),
+            },
+            "expires_at": time.time() + timeout if timeout else None,
+        }
+        cache.set(self.token_cache_key, token_data, timeout)
+
+        return token_data
+
+    def _set_token(self, token_data):
+        self._headers = token_data["headers"]
+        self._expires_at = token_data["expires_at"]
+        self.session.headers.update(self._headers)
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends an authenticated request through the scheduler of the client.
+
+        The access token is requested again once if SurveyMonkey rejects it.
+        """
+        response = self.scheduler.request(self.session, method, url, **kwargs)
+
+        if response.status_code == 401:
+            LOG.warning("Surveymonkey access token rejected for the client %s", self.client_id)
+            response.close()
+            self.invalidate_token()
+            self.get_headers()
+            response = self.scheduler.request(self.session, method, url, **kwargs)
+
+        return response
+
+    async def get_headers_async(self):
+        """
+        Returns the authorization headers without blocking the event loop, the token is looked up
+        in the cache or requested in the default executor of the loop when it is not valid.
+        """
+        if self._is_token_valid():
+            return self._headers
+
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_headers)
+
+    async def request_async(self, async_client, method, url, **kwargs):
+        """
+        Sends an authenticated request with an httpx.AsyncClient through the scheduler of the client.
+        """
+        kwargs["headers"] = dict(kwargs.get("headers") or {}, **(await self.get_headers_async()))
+        response = await self.scheduler.request_async(async_client, method, url, **kwargs)
+
+        if response.status_code == 401:
+            LOG.warning("Surveymonkey access token rejected for the client %s", self.client_id)
+            self.invalidate_token()
+            kwargs["headers"].update(await self.get_headers_async())
+            response = await self.scheduler.request_async(async_client, method, url, **kwargs)
+
+        return response
+
+    def invalidate_token(self):
+        """
+        Forgets the current access token, e.g. after SurveyMonkey rejected it.
+        """
+        with self._token_lock:
+            self._headers = None
+            self._expires_at = None
+            self.session.headers.pop("Authorization", None)
+            cache.delete(self.token_cache_key)
+
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(client_id, client_secret, default_duration=None):
+    """
+    Returns the process-wide SurveyMonkeyClient of the client_id and client_secret pair.
+
+    The blocks using the same client id with different secrets, e.g. while the secret is being
+    changed in Studio, get their own client instead of replacing each other's. A new client is
+    only kept once it gets an access token, so wrong credentials do not leave clients behind.
+
+    Args:
+        default_duration: Seconds to keep the token when SurveyMonkey does not return expires_in.
+    Raises:
+        oauthlib.oauth2.OAuth2Error: If the access token of a new client can not be requested.
+    """
+    key = (client_id, client_secret)
+
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+
+    if client is not None:
+        return client
+
+    client = SurveyMonkeyClient(client_id, client_secret)
+
+    try:
+        client.get_headers(default_duration)
+    except Exception:
+        client.session.close()
+        raise
+
+    with _CLIENTS_LOCK:
+        registered_client = _CLIENTS.setdefault(key, client)
+
+    if registered_client is not client:
+        # Another thread registered its client first.
+        client.session.close()
+
+    return registered_client
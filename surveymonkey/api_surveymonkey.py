@@ -1,59 +1,152 @@
 """
 This Api class allows to authenticate and make request to the surveymonkey API_BASE
 """
+import hashlib
 import logging
-import requests
+import time
 
 from django.core.cache import cache
-from requests_oauthlib import OAuth2Session
-from oauthlib.oauth2 import BackendApplicationClient
+
+from .api_session import API_BASE, get_client
+from .jobs import CACHE_REFRESH_JOB_QUEUE, get_job_queue
+from .metrics import record_cache_lookup
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
 
 LOG = logging.getLogger(__name__)
-API_BASE = "https://api.surveymonkey.com"
 SURVEY_MONKEY_API_TAG = "api_survey_monkey"
+# Default number of items requested per page, 100 is the maximum allowed by the bulk endpoints.
+DEFAULT_PER_PAGE = 100
+# Collector fields requested by the blocks, to find the weblink collectors and their urls.
+COLLECTORS_INCLUDE = "url,type,survey_id"
+# Minimum number of seconds between two incremental refreshes of a response index.
+RESPONSE_INDEX_REFRESH_INTERVAL = 60
+RESPONSE_INDEX_LOCK_TIMEOUT = 30
+# Fraction of the cache duration after which the cached values are refreshed in the background.
+SOFT_EXPIRY_RATIO = 0.8
+CACHE_FILL_LOCK_TIMEOUT = 30
+CACHE_FILL_WAIT = 5
+CACHE_FILL_POLL_INTERVAL = 0.1
+# JSON path of the items and of the next page url in the body of the list endpoints.
+PAGE_ITEM_PREFIX = "data.item"
+PAGE_NEXT_PREFIX = "links.next"
+
+
+class ApiSurveyMonkeyError(Exception):
+    """
+    Raised by the iter_* methods called with raise_errors when a page could not be returned.
+    """
 
 
-class ApiSurveyMonkey(object):
+def get_heading_hash(heading):
     """
-    Class with the necessary methods to make request to surveymonkey API_BASE
+    Returns the hash used to compare question headings.
     """
-    def __init__(self, client_id, client_secret, cache_duration):
-        self.session = requests.Session()
-        self.client_id = client_id
-        self.surveymonkey_api_cache_duration = cache_duration
+    return hashlib.sha1(heading.encode("utf-8")).hexdigest()
+
 
-        key = "{}-{}-{}".format(SURVEY_MONKEY_API_TAG, client_id, client_secret)
-        headers = cache.get(key)
+def get_cache_key(name, *args):
+    """
+    Returns the cache key of a SurveyMonkey API value, e.g. get_cache_key("all_surveys", client_id).
+    """
+    return "-".join([SURVEY_MONKEY_API_TAG, name] + [str(arg) for arg in args])
 
-        if not headers:
-            headers = self.authenticate(client_id, client_secret)
-            cache.set(key, headers, cache_duration)
 
-        self.session.headers.update(headers)
+def get_cache_family(cache_key):
+    """
+    Returns the name given to get_cache_key for the given cache key, e.g. all_surveys.
+    """
+    return cache_key.split("-")[1]
 
-    def authenticate(self, client_id, client_secret):
-        """
-        This method return a dict with the authorization token
-        """
-        client = BackendApplicationClient(client_id=client_id)
-        oauth = OAuth2Session(client=client)
-        authenticate_url = "{}/{}".format(API_BASE, "oauth/token")
-        headers = {}
 
-        token = oauth.fetch_token(
-            token_url=authenticate_url,
-            client_id=client_id,
-            client_secret=client_secret
-        )
+def get_payload_key_parts(payload):
+    """
+    Returns the query parameters of a request as sorted key=value strings to add them to a cache key.
+    """
+    return sorted("{}={}".format(key, value) for key, value in payload.items())
+
+
+def build_cache_entry(value, cache_duration):
+    """
+    Returns the cached representation of value, with the time after which it is refreshed.
+    """
+    return {
+        "value": value,
+        "soft_expires_at": time.time() + cache_duration * SOFT_EXPIRY_RATIO,
+    }
+
+
+def is_cache_entry(cache_entry):
+    """
+    Returns True if cache_entry was built with build_cache_entry.
+    """
+    return isinstance(cache_entry, dict) and "soft_expires_at" in cache_entry
+
+
+def is_streaming_available():
+    """
+    Returns True if the ijson package needed to parse the bulk responses incrementally is installed.
+    """
+    return ijson is not None
+
+
+def iter_streamed_page(stream):
+    """
+    Parses the body of a list endpoint page as it is read from stream.
+
+    Yields ("item", item) for every data item, once it is complete, and ("next", url) for
+    the next page url, so only one item is kept in memory at a time.
+    """
+    builder = None
 
-        headers["Authorization"] = "{} {}".format("Bearer", token.get("access_token"))
-        return headers
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+
+            if prefix == PAGE_ITEM_PREFIX and event in ("end_map", "end_array"):
+                yield "item", builder.value
+                builder = None
+        elif prefix == PAGE_ITEM_PREFIX and event in ("start_map", "start_array"):
+            builder = ObjectBuilder()
+            builder.event(event, value)
+        elif prefix == PAGE_NEXT_PREFIX and event == "string":
+            yield "next", value
+
+
+def build_survey_title_index(surveys):
+    """
+    Returns a dict with the list of surveys of every survey title.
+    """
+    title_index = {}
+
+    for survey in surveys:
+        title_index.setdefault(survey.get("title"), []).append(survey)
+
+    return title_index
+
+
+class ApiSurveyMonkey(object):
+    """
+    Class with the necessary methods to make request to surveymonkey API_BASE
+    """
+    def __init__(self, client_id, client_secret, cache_duration, per_page=DEFAULT_PER_PAGE):
+        self.client = get_client(client_id, client_secret, cache_duration)
+        self.session = self.client.session
+        self.client_id = client_id
+        self.surveymonkey_api_cache_duration = cache_duration
+        self.per_page = per_page
+
+        self.client.get_headers(cache_duration)
 
     def __call_api_post(self, url, data):
         """
         This uses the session to make a POST request and returns the response
         """
-        response = self.session.post(url=url, json=data)
+        response = self.client.request("post", url, json=data)
         LOG.info("Surveymonkey post response with status code = %s %s", response.status_code, url)
         return response
 
@@ -61,7 +154,7 @@ class ApiSurveyMonkey(object):
         """
         This uses the session to make a GET request and return the response
         """
-        response = self.session.get(url=url, params=payload)
+        response = self.client.request("get", url, params=payload)
         LOG.info("Surveymonkey get response with status code = %s %s", response.status_code, url)
         return response
 
@@ -69,15 +162,132 @@ class ApiSurveyMonkey(object):
         """
         This uses the session to make a PATCH request and return the response.
         """
-        response = self.session.patch(url=url, json=payload)
+        response = self.client.request("patch", url, json=payload)
 
         LOG.info("Surveymonkey PATCH response with status code = %s %s", response.status_code, url)
 
         return response
 
-    def get_collector_responses(self, collector_id, **kwargs):
+    def _iter_pages(self, url, payload, per_page=None):
         """
-        Retrieves a list of full expanded responses, including answers to all questions.
+        Yields the (status_code, page data) of every page of a list endpoint following links.next.
+
+        The iteration stops after the first page that is not successfully returned.
+
+        Args:
+            url: Url of the first page.
+            payload: Query parameters of the first page, the next links already contain them.
+            per_page: Number of items per page, defaults to the per_page of the instance.
+        """
+        params = dict(payload)
+        params.setdefault("per_page", per_page or self.per_page)
+
+        while url:
+            response = self.__call_api_get(url, params)
+
+            if response.status_code != 200:
+                yield response.status_code, {}
+                return
+
+            page = response.json()
+            yield response.status_code, page
+
+            url = page.get("links", {}).get("next")
+            params = {}
+
+    def _iter_items(self, url, payload, per_page, error_message, stream=False, raise_errors=False):
+        """
+        Yields the data items of every page of a list endpoint.
+
+        With stream, the pages are parsed incrementally if ijson is installed, see _iter_streamed_items.
+        The iteration stops at the first page that could not be returned, raising ApiSurveyMonkeyError
+        with raise_errors, so the callers can tell an incomplete list from a complete one.
+        """
+        if stream and is_streaming_available():
+            for item in self._iter_streamed_items(url, payload, per_page, error_message, raise_errors):
+                yield item
+
+            return
+
+        for status_code, page in self._iter_pages(url, payload, per_page):
+            if status_code != 200:
+                self._handle_items_error(error_message, status_code, raise_errors)
+                return
+
+            for item in page.get("data", []):
+                yield item
+
+    @staticmethod
+    def _handle_items_error(error_message, error, raise_errors):
+        """
+        Logs the error that stopped a list iteration, and raises it with raise_errors.
+        """
+        LOG.error(error_message, error)
+
+        if raise_errors:
+            raise ApiSurveyMonkeyError(error_message % (error,))
+
+    def _iter_streamed_items(self, url, payload, per_page, error_message, raise_errors=False):
+        """
+        Yields the data items of every page of a list endpoint as the page bodies are read.
+
+        The peak memory does not depend on the page size, and the response is closed when
+        the caller stops the iteration early, e.g. after finding the response of an user.
+        """
+        params = dict(payload)
+        params.setdefault("per_page", per_page or self.per_page)
+
+        while url:
+            response = self.client.request("get", url, params=params, stream=True)
+            LOG.info("Surveymonkey get response with status code = %s %s", response.status_code, url)
+
+            if response.status_code != 200:
+                response.close()
+                self._handle_items_error(error_message, response.status_code, raise_errors)
+                return
+
+            url = None
+            params = {}
+
+            try:
+                response.raw.decode_content = True
+
+                for kind, value in iter_streamed_page(response.raw):
+                    if kind == "next":
+                        url = value
+                    else:
+                        yield value
+            except Exception as error:
+                self._handle_items_error(error_message, error, raise_errors)
+                return
+            finally:
+                response.close()
+
+    def _get_all_pages(self, url, payload, error_message):
+        """
+        Returns a dict with the data items of all the pages of a list endpoint, or an empty
+        dict if any page could not be returned.
+        """
+        data = []
+
+        for status_code, page in self._iter_pages(url, payload):
+            if status_code != 200:
+                LOG.error(error_message, status_code)
+                return {}
+
+            data.extend(page.get("data", []))
+
+        return {
+            "data": data,
+            "total": len(data),
+        }
+
+    def iter_collector_responses(self, collector_id, per_page=None, raise_errors=False, **kwargs):
+        """
+        Yields the full expanded responses of the collector, page by page.
+
+        The pages are parsed as they are received if ijson is installed. With raise_errors,
+        ApiSurveyMonkeyError is raised if a page could not be returned.
         """
         url = "{}/{}/{}/{}".format(
             API_BASE,
@@ -85,85 +295,140 @@ class ApiSurveyMonkey(object):
             collector_id,
             "responses/bulk"
         )
-        response = self.__call_api_get(url, kwargs)
+        return self._iter_items(
+            url,
+            kwargs,
+            per_page,
+            "An error has ocurred trying to get collector responses = %s",
+            stream=True,
+            raise_errors=raise_errors,
+        )
 
-        # TODO add support for next pages.
-        if response.status_code == 200:
-            return response.json()
+    def get_collector_responses(self, collector_id, **kwargs):
+        """
+        Retrieves a list of full expanded responses, including answers to all questions.
+        """
+        return {"data": list(self.iter_collector_responses(collector_id, **kwargs))}
 
-        LOG.error("An error has ocurred trying to get collector responses = %s", response.status_code)
-        return {}
+    def iter_surveys(self, per_page=None, raise_errors=False, **kwargs):
+        """
+        Yields the surveys owned or shared with the authenticated user, page by page.
+
+        With raise_errors, ApiSurveyMonkeyError is raised if a page could not be returned.
+        """
+        url = "{}/{}".format(
+            API_BASE,
+            "v3/surveys",
+        )
+        return self._iter_items(
+            url,
+            kwargs,
+            per_page,
+            "An error has ocurred trying to get surveys = %s",
+            raise_errors=raise_errors,
+        )
 
     def get_surveys(self, **kwargs):
         """
         Returns a list of surveys owned or shared with the authenticated user.
+
+        The title_index key of the result maps every survey title to the surveys with that title.
         """
-        cache_key = "{}-{}-{}".format(SURVEY_MONKEY_API_TAG, "all_surveys", self.client_id)
-        all_surveys_data = cache.get(cache_key)
+        cache_key = get_cache_key("all_surveys", self.client_id)
 
-        if not self.surveymonkey_api_cache_duration:
-            cache.delete(cache_key)
-        elif all_surveys_data:
-            return all_surveys_data
+        return self._get_cached(cache_key, self._fetch_surveys, kwargs)
 
+    def _fetch_surveys(self, payload):
+        """
+        Requests all the pages of the survey list and indexes them by title.
+        """
         url = "{}/{}".format(
             API_BASE,
             "v3/surveys",
         )
-        response = self.__call_api_get(url, kwargs)
+        all_surveys_data = self._get_all_pages(url, payload, "An error has ocurred trying to get surveys = %s")
 
-        # TODO add support for next pages.
-        if response.status_code == 200:
-            cache.set(cache_key, response.json(), self.surveymonkey_api_cache_duration)
-            return response.json()
+        if all_surveys_data:
+            all_surveys_data["title_index"] = build_survey_title_index(all_surveys_data["data"])
 
-        LOG.error("An error has ocurred trying to get surveys = %s", response.status_code)
-        return {}
+        return all_surveys_data
 
-    def get_collectors(self, survey_id, block_location_id, **kwargs):
+    def get_surveys_by_title(self, title):
         """
-        Returns a list of collectors for a given survey.
+        Returns the list of surveys with the given title.
         """
-        cache_key = "{}-{}-{}-{}".format(SURVEY_MONKEY_API_TAG, "all_collectors", self.client_id, block_location_id)
-        all_collectors_data = cache.get(cache_key)
+        all_surveys_data = self.get_surveys()
 
-        if not self.surveymonkey_api_cache_duration:
-            cache.delete(cache_key)
-        elif all_collectors_data:
-            return all_collectors_data
+        if not all_surveys_data:
+            return []
+
+        title_index = all_surveys_data.get("title_index")
+
+        if title_index is None:
+            # Survey list cached before the title index was added.
+            title_index = build_survey_title_index(all_surveys_data.get("data", []))
+
+        return title_index.get(title, [])
 
+    def iter_collectors(self, survey_id, per_page=None, raise_errors=False, **kwargs):
+        """
+        Yields the collectors of the given survey, page by page.
+
+        With raise_errors, ApiSurveyMonkeyError is raised if a page could not be returned.
+        """
         url = "{}/{}/{}/{}".format(
             API_BASE,
             "v3/surveys",
             survey_id,
             "collectors"
         )
-        response = self.__call_api_get(url, kwargs)
+        return self._iter_items(
+            url,
+            kwargs,
+            per_page,
+            "An error has ocurred trying to get collectors = %s",
+            raise_errors=raise_errors,
+        )
 
-        if response.status_code == 200:
-            cache.set(cache_key, response.json(), self.surveymonkey_api_cache_duration)
-            return response.json()
+    def get_collectors(self, survey_id, **kwargs):
+        """
+        Returns a list of collectors for a given survey.
 
-        LOG.error("An error has ocurred trying to get surveys = %s", response.status_code)
-        return {}
+        The collectors are cached by survey, so the blocks using the same survey share them.
+        """
+        cache_key = get_cache_key("all_collectors", self.client_id, survey_id, *get_payload_key_parts(kwargs))
+        url = "{}/{}/{}/{}".format(
+            API_BASE,
+            "v3/surveys",
+            survey_id,
+            "collectors"
+        )
 
-    def get_survey_details(self, survey_id, block_location_id):
+        return self._get_cached(
+            cache_key,
+            self._get_all_pages,
+            url,
+            kwargs,
+            "An error has ocurred trying to get collectors = %s",
+        )
+
+    def get_survey_details(self, survey_id):
         """
-        Returns the survey details for the given survey_id.
+        Returns the survey details for the given survey_id, cached by survey.
 
         Args:
             survey_id: SurveyMonkey survey id.
         Returns:
             response: requests.models.Response.json instance.
         """
-        cache_key = "{}-{}-{}-{}".format(SURVEY_MONKEY_API_TAG, "survey_details", self.client_id, block_location_id)
-        survey_details = cache.get(cache_key)
+        cache_key = get_cache_key("survey_details", self.client_id, survey_id)
 
-        if not self.surveymonkey_api_cache_duration:
-            cache.delete(cache_key)
-        elif survey_details:
-            return survey_details
+        return self._get_cached(cache_key, self._fetch_survey_details, survey_id)
 
+    def _fetch_survey_details(self, survey_id):
+        """
+        Requests the survey details for the given survey_id.
+        """
         url = "{}/v3/surveys/{}/details".format(
             API_BASE,
             survey_id,
@@ -171,9 +436,109 @@ class ApiSurveyMonkey(object):
         response = self.__call_api_get(url, {})
 
         if response.status_code == 200:
-            cache.set(cache_key, response.json(), self.surveymonkey_api_cache_duration)
             return response.json()
 
+        LOG.error("An error has ocurred trying to get the survey details = %s", response.status_code)
+        return None
+
+    def _get_cached(self, cache_key, fetch, *args):
+        """
+        Returns the cached value of cache_key, calling fetch(*args) to fill the cache.
+
+        The values are kept for the cache duration, but after SOFT_EXPIRY_RATIO of it the
+        stale value is returned while it is refreshed by the cache refresh job queue. Only one
+        worker fetches a missing value, the others wait for it up to CACHE_FILL_WAIT seconds.
+        """
+        if not self.surveymonkey_api_cache_duration:
+            cache.delete(cache_key)
+            return fetch(*args)
+
+        cache_entry = cache.get(cache_key)
+        record_cache_lookup(get_cache_family(cache_key), is_cache_entry(cache_entry))
+
+        if is_cache_entry(cache_entry):
+            if time.time() >= cache_entry["soft_expires_at"]:
+                get_job_queue(CACHE_REFRESH_JOB_QUEUE).enqueue(
+                    ("refresh", cache_key),
+                    self._fill_cache,
+                    cache_key,
+                    fetch,
+                    args,
+                    False,
+                )
+
+            return cache_entry["value"]
+
+        return self._fill_cache(cache_key, fetch, args)
+
+    def _fill_cache(self, cache_key, fetch, args, wait=True):
+        """
+        Fetches the value of cache_key and stores it with its soft expiry time.
+
+        Args:
+            cache_key: Key of the cached value.
+            fetch: Callable returning the value.
+            args: Arguments passed to fetch.
+            wait: False to skip the fetch if another worker is already fetching the value.
+        """
+        lock_key = "{}-{}".format(cache_key, "lock")
+        locked = cache.add(lock_key, True, CACHE_FILL_LOCK_TIMEOUT)
+
+        if not (locked or wait):
+            return None
+
+        if not locked:
+            # Another worker is fetching this value, wait for it before calling the API.
+            deadline = time.time() + CACHE_FILL_WAIT
+
+            while time.time() < deadline:
+                time.sleep(CACHE_FILL_POLL_INTERVAL)
+                cache_entry = cache.get(cache_key)
+
+                if is_cache_entry(cache_entry) and time.time() < cache_entry["soft_expires_at"]:
+                    return cache_entry["value"]
+
+        try:
+            value = fetch(*args)
+
+            if value:
+                cache.set(
+                    cache_key,
+                    build_cache_entry(value, self.surveymonkey_api_cache_duration),
+                    self.surveymonkey_api_cache_duration,
+                )
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+        return value
+
+    def iter_survey_responses(self, survey_id, per_page=None, raise_errors=False, **kwargs):
+        """
+        Yields the bulk survey responses for the given survey_id, page by page.
+
+        The pages are parsed as they are received if ijson is installed, so stopping the
+        iteration after the wanted response does not read the rest of the page.
+
+        Args:
+            survey_id: SurveyMonkey survey id.
+            per_page: Number of responses requested per page.
+            raise_errors: True to raise ApiSurveyMonkeyError if a page could not be returned.
+            kwargs: Request data.
+        """
+        url = "{}/v3/surveys/{}/responses/bulk".format(
+            API_BASE,
+            survey_id,
+        )
+        return self._iter_items(
+            url,
+            kwargs,
+            per_page,
+            "An error has ocurred trying to GET the survey responses: %s",
+            stream=True,
+            raise_errors=raise_errors,
+        )
+
     def get_survey_responses(self, survey_id, **kwargs):
         """
         Returns the bulk survey responses for the given survey_id.
@@ -181,21 +546,50 @@ class ApiSurveyMonkey(object):
         Args:
             survey_id: SurveyMonkey survey id.
             kwargs: Request data.
+        Returns:
+            response: Dict with the responses of all the pages in the data key.
+        """
+        return {"data": list(self.iter_survey_responses(survey_id, **kwargs))}
+
+    def get_survey_response(self, survey_id, response_id, **kwargs):
+        """
+        Returns a response of the given survey_id.
+
+        Args:
+            survey_id: SurveyMonkey survey id.
+            response_id: SurveyMonkey response id.
+            kwargs: Request data.
         Returns:
             response: requests.models.Response.json instance.
         """
-        url = "{}/v3/surveys/{}/responses/bulk".format(
+        url = "{}/v3/surveys/{}/responses/{}".format(
             API_BASE,
             survey_id,
+            response_id,
         )
         response = self.__call_api_get(url, kwargs)
 
         if response.status_code == 200:
             return response.json()
 
-        LOG.error("An error has ocurred trying to GET the survey responses: %s", response.status_code)
+        LOG.error("An error has ocurred trying to GET the survey response: %s", response.status_code)
         return {}
 
+    def invalidate_survey(self, survey_id):
+        """
+        Removes the cached survey list and details, e.g. after the survey was updated in SurveyMonkey.
+        """
+        cache.delete_many([
+            get_cache_key("all_surveys", self.client_id),
+            get_cache_key("survey_details", self.client_id, survey_id),
+        ])
+
+    def invalidate_collectors(self, survey_id, **kwargs):
+        """
+        Removes the cached collectors of the survey requested with the given query parameters.
+        """
+        cache.delete(get_cache_key("all_collectors", self.client_id, survey_id, *get_payload_key_parts(kwargs)))
+
     def patch_question_data(self, survey_id, page_id, question_id, **kwargs):
         """
         Makes a PATCH request to update the question data.
@@ -222,3 +616,302 @@ class ApiSurveyMonkey(object):
 
         LOG.error("An error has ocurred trying to PATCH the question survey: %s", response.status_code)
         return {}
+
+    def overwrite_question_headings(self, survey_id, question_headings):
+        """
+        Overwrites the headings of the questions of the first page of the survey.
+
+        Args:
+            survey_id: SurveyMonkey survey id.
+            question_headings: List of headings, in the same order of the survey questions.
+        """
+        survey_details = self.get_survey_details(survey_id) or {}
+        survey_pages = survey_details.get("pages", [])
+
+        if not survey_pages:
+            return None
+
+        # Let's take the first page of the survey because API calls do not support pagination.
+        page_id = survey_pages[0].get("id", "")
+        survey_questions = survey_pages[0].get("questions", [])
+        changed_questions = self._get_changed_question_headings(survey_id, survey_questions, question_headings)
+
+        # The PATCH requests are independent, so they are sent concurrently.
+        responses = self.call_concurrently([
+            (
+                "patch_question_data",
+                (survey_id, page_id, question_id),
+                {"headings": [{"heading": question_heading}]},
+            )
+            for question_id, question_heading in changed_questions
+        ])
+
+        for (question_id, question_heading), response in zip(changed_questions, responses):
+            if response:
+                cache.set(
+                    self._get_question_heading_key(survey_id, question_id),
+                    get_heading_hash(question_heading),
+                    self.surveymonkey_api_cache_duration,
+                )
+
+        return None
+
+    def call_concurrently(self, calls):
+        """
+        Sends independent calls of this class concurrently, see api_surveymonkey_async.call_concurrently.
+        """
+        # Imported here because the async module imports this one.
+        from .api_surveymonkey_async import call_concurrently
+
+        return call_concurrently(self, calls)
+
+    def _get_changed_question_headings(self, survey_id, survey_questions, question_headings):
+        """
+        Returns the (question_id, heading) pairs whose heading differs from the current one.
+
+        The current heading is the hash stored after the last PATCH of the question, or the
+        heading in the cached survey details when there is no stored hash.
+        """
+        questions = [
+            (question.get("id", ""), question_heading, question.get("headings", []))
+            for question, question_heading in zip(survey_questions, question_headings)
+        ]
+        stored_hashes = cache.get_many([
+            self._get_question_heading_key(survey_id, question_id) for question_id, _, _ in questions
+        ])
+        changed_questions = []
+
+        for question_id, question_heading, current_headings in questions:
+            current_hash = stored_hashes.get(self._get_question_heading_key(survey_id, question_id))
+
+            if current_hash is None and current_headings:
+                current_hash = get_heading_hash(current_headings[0].get("heading", ""))
+
+            if current_hash != get_heading_hash(question_heading):
+                changed_questions.append((question_id, question_heading))
+
+        return changed_questions
+
+    def _get_question_heading_key(self, survey_id, question_id):
+        """
+        Returns the cache key of the heading hash of the given survey question.
+        """
+        return get_cache_key("question_heading", self.client_id, survey_id, question_id)
+
+    def get_user_survey_response(self, survey_id, uid):
+        """
+        Returns the bulk response submitted by uid for the given survey_id.
+
+        The responses are indexed by (survey_id, uid) in the cache, so this is a single
+        cache lookup once the index is built. The index is built the first time it is
+        needed and then refreshed incrementally with the start_modified_at filter when
+        an uid is not found. After SOFT_EXPIRY_RATIO of the cache duration the index is
+        built again by the cache refresh job queue while its entries are still returned.
+        The users looking up an index being built by another worker wait for it.
+
+        Args:
+            survey_id: SurveyMonkey survey id.
+            uid: Value of the uid custom variable, i.e. the user anonymous id.
+        Returns:
+            response: Bulk response data of the user or an empty dict.
+        """
+        if not self.surveymonkey_api_cache_duration:
+            return self._find_user_survey_response(survey_id, uid)
+
+        index_key = self._get_response_index_key(survey_id)
+        entry_key = self._get_response_index_key(survey_id, uid)
+        cached_data = cache.get_many([index_key, entry_key])
+        index_data = cached_data.get(index_key)
+        user_response = cached_data.get(entry_key)
+        record_cache_lookup("response_index", bool(index_data and user_response))
+
+        if index_data and time.time() >= self._get_response_index_soft_expiry(index_data):
+            get_job_queue(CACHE_REFRESH_JOB_QUEUE).enqueue(
+                ("rebuild_response_index", self.client_id, survey_id),
+                self._rebuild_response_index,
+                survey_id,
+            )
+
+        if index_data and user_response:
+            return user_response
+
+        if index_data and time.time() - index_data.get("refreshed_at", 0) < RESPONSE_INDEX_REFRESH_INTERVAL:
+            return user_response or {}
+
+        if self._refresh_response_index(survey_id, index_data):
+            return cache.get(entry_key) or {}
+
+        if index_data:
+            return user_response or {}
+
+        return self._wait_for_response_index(survey_id, uid)
+
+    def refresh_response_index(self, survey_id):
+        """
+        Builds the response index of survey_id, or updates it with the responses modified since
+        its last refresh.
+
+        Returns:
+            Boolean: True if the index was refreshed.
+        """
+        if not self.surveymonkey_api_cache_duration:
+            return False
+
+        return self._refresh_response_index(survey_id, cache.get(self._get_response_index_key(survey_id)))
+
+    def add_to_response_index(self, survey_id, response):
+        """
+        Stores a new or updated bulk response in the response index of survey_id, if it is built.
+        """
+        uid = response.get("custom_variables", {}).get("uid")
+
+        if not (uid and self.surveymonkey_api_cache_duration):
+            return None
+
+        if cache.get(self._get_response_index_key(survey_id)):
+            cache.set(self._get_response_index_key(survey_id, uid), response, self.surveymonkey_api_cache_duration)
+
+        return None
+
+    def _wait_for_response_index(self, survey_id, uid):
+        """
+        Waits up to CACHE_FILL_WAIT seconds for the response index being built by another worker.
+
+        The users do not scan the responses themselves if it is not built by then, so a slow
+        build is not followed by a full scan per waiting user.
+        """
+        index_key = self._get_response_index_key(survey_id)
+        entry_key = self._get_response_index_key(survey_id, uid)
+        deadline = time.time() + CACHE_FILL_WAIT
+
+        while time.time() < deadline:
+            time.sleep(CACHE_FILL_POLL_INTERVAL)
+            cached_data = cache.get_many([index_key, entry_key])
+
+            if cached_data.get(index_key):
+                return cached_data.get(entry_key) or {}
+
+        LOG.warning("The response index of the survey %s is still being built, %s is not found", survey_id, uid)
+        return {}
+
+    def _find_user_survey_response(self, survey_id, uid):
+        """
+        Scans the bulk survey responses looking for the response submitted by uid.
+        """
+        for response in self.iter_survey_responses(survey_id, simple="true"):
+            if response.get("custom_variables", {}).get("uid") == uid:
+                return response
+
+        return {}
+
+    def _get_response_index_key(self, survey_id, uid=None):
+        """
+        Returns the cache key of the response index of survey_id or of one of its entries.
+        """
+        key = get_cache_key("response_index", self.client_id, survey_id)
+
+        if uid is None:
+            return key
+
+        return "{}-{}".format(key, uid)
+
+    def _get_response_index_soft_expiry(self, index_data):
+        """
+        Returns the time after which the response index is built again in the background.
+        """
+        return index_data.get("built_at", 0) + self.surveymonkey_api_cache_duration * SOFT_EXPIRY_RATIO
+
+    def _rebuild_response_index(self, survey_id):
+        """
+        Builds the response index of survey_id again, unless it was already rebuilt since it was enqueued.
+        """
+        index_data = cache.get(self._get_response_index_key(survey_id))
+
+        if index_data and time.time() < self._get_response_index_soft_expiry(index_data):
+            return False
+
+        return self._refresh_response_index(survey_id)
+
+    def _refresh_response_index(self, survey_id, index_data=None):
+        """
+        Fetches the responses modified since the last refresh and stores them in the response index,
+        or builds the whole index if there is no index data.
+
+        The entries written when the index is built expire after the cache duration, and the
+        unchanged responses are not fetched again by the incremental refreshes, so the index
+        key expires with them. It is usually built again in the background before, see
+        get_user_survey_response.
+
+        Args:
+            survey_id: SurveyMonkey survey id.
+            index_data: Cached index data with the watermark of the last refresh, or None.
+        Returns:
+            Boolean: True if the index was refreshed, False if another worker is refreshing it
+            or the responses could not be returned.
+        """
+        index_key = self._get_response_index_key(survey_id)
+        lock_key = "{}-{}".format(index_key, "lock")
+
+        if not cache.add(lock_key, True, RESPONSE_INDEX_LOCK_TIMEOUT):
+            # Another worker is already refreshing this index.
+            return False
+
+        try:
+            kwargs = {
+                "simple": "true",
+                "sort_by": "date_modified",
+                "sort_order": "ASC",
+            }
+            built_at = index_data.get("built_at") if index_data else None
+            last_modified = None
+
+            if built_at is None:
+                built_at = time.time()
+            else:
+                last_modified = index_data.get("last_modified")
+
+            if last_modified:
+                kwargs["start_modified_at"] = last_modified
+
+            index_entries = {}
+
+            try:
+                for response in self.iter_survey_responses(survey_id, raise_errors=True, **kwargs):
+                    uid = response.get("custom_variables", {}).get("uid")
+                    date_modified = response.get("date_modified", "")
+
+                    if uid:
+                        index_entries[self._get_response_index_key(survey_id, uid)] = response
+
+                    if date_modified:
+                        # SurveyMonkey expects the YYYY-MM-DDTHH:MM:SS format in start_modified_at.
+                        last_modified = max(last_modified or "", date_modified[:19])
+
+                    if len(index_entries) >= self.per_page:
+                        cache.set_many(index_entries, self.surveymonkey_api_cache_duration)
+                        index_entries = {}
+            except ApiSurveyMonkeyError:
+                # The stored entries are kept, but the watermark is not moved past the missing responses.
+                return False
+
+            if index_entries:
+                cache.set_many(index_entries, self.surveymonkey_api_cache_duration)
+
+            index_timeout = int(built_at + self.surveymonkey_api_cache_duration - time.time())
+
+            if index_timeout > 0:
+                cache.set(
+                    index_key,
+                    {
+                        "last_modified": last_modified,
+                        "refreshed_at": time.time(),
+                        "built_at": built_at,
+                    },
+                    index_timeout,
+                )
+            else:
+                cache.delete(index_key)
+        finally:
+            cache.delete(lock_key)
+
+        return True
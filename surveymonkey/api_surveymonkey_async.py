@@ -0,0 +1,452 @@
+"""
+Asynchronous version of the ApiSurveyMonkey class, used to send independent requests concurrently.
+
+It requires the optional httpx package. The values are cached with the same keys of
+ApiSurveyMonkey, so both classes share the cached surveys, collectors and details.
+"""
+import asyncio
+import functools
+import logging
+import threading
+
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .api_session import API_BASE, DEFAULT_POOL_MAXSIZE, get_client
+from .api_surveymonkey import (
+    DEFAULT_PER_PAGE,
+    ApiSurveyMonkeyError,
+    build_cache_entry,
+    build_survey_title_index,
+    get_cache_key,
+    get_payload_key_parts,
+    is_cache_entry,
+)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+LOG = logging.getLogger(__name__)
+# Maximum seconds call_concurrently waits for the results of the calls.
+DEFAULT_CONCURRENT_CALLS_TIMEOUT = 60
+
+
+def is_async_api_available():
+    """
+    Returns True if the httpx package needed by AsyncApiSurveyMonkey is installed.
+    """
+    return httpx is not None
+
+
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+# httpx.AsyncClient of every (client_id, client_secret), only used by the coroutines run in _LOOP.
+_ASYNC_CLIENTS = {}
+_ASYNC_CLIENTS_LOCK = threading.Lock()
+
+
+def get_event_loop():
+    """
+    Returns the process-wide event loop where call_concurrently runs, started in a daemon thread on first use.
+
+    The loop and its httpx.AsyncClients live as long as the process, so the concurrent calls
+    reuse the keep-alive connections instead of opening new ones every time. The loop is
+    shared by all the threads of the process, so the coroutines run in it must not block:
+    the cache and token calls are run in its default executor, see run_blocking.
+    """
+    global _LOOP
+
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="surveymonkey-async-loop")
+            thread.daemon = True
+            thread.start()
+            _LOOP = loop
+
+    return _LOOP
+
+
+def build_async_client():
+    """
+    Returns a keep-alive httpx.AsyncClient with a connection pool sized for concurrent requests.
+    """
+    pool_maxsize = getattr(settings, "SURVEYMONKEY_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE)
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize),
+    )
+
+
+def get_pooled_async_client(client_id, client_secret):
+    """
+    Returns the httpx.AsyncClient kept for the SurveyMonkey application, to be used in the loop
+    returned by get_event_loop.
+    """
+    key = (client_id, client_secret)
+
+    with _ASYNC_CLIENTS_LOCK:
+        async_client = _ASYNC_CLIENTS.get(key)
+
+        if async_client is None or async_client.is_closed:
+            async_client = build_async_client()
+            _ASYNC_CLIENTS[key] = async_client
+
+    return async_client
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking call, e.g. a cache lookup, in the default executor of the running loop.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+def _run(coroutine, timeout):
+    """
+    Runs the coroutine in the process-wide event loop and returns its result.
+
+    Raises:
+        concurrent.futures.TimeoutError: If the coroutine does not finish in timeout seconds, it is cancelled.
+    """
+    loop = get_event_loop()
+
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+
+    if running_loop is loop:
+        coroutine.close()
+        raise RuntimeError("call_concurrently can not be called from the coroutines it runs.")
+
+    future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise
+
+
+def call_concurrently(api_survey_monkey, calls):
+    """
+    Sends the given independent ApiSurveyMonkey calls concurrently and returns their results in order.
+
+    The calls run in the process-wide event loop with the pooled httpx.AsyncClient of the
+    application. They are sent one by one with api_survey_monkey if httpx is not installed.
+
+    Args:
+        api_survey_monkey: Instance of api_surveymonkey.ApiSurveyMonkey.
+        calls: List of (method name, args, kwargs) tuples, e.g.
+            [("get_survey_details", (survey_id,), {}), ("get_surveys", (), {})]
+    Returns:
+        List: Results of the calls, None for all of them if they do not finish in
+        SURVEYMONKEY_CONCURRENT_CALLS_TIMEOUT seconds.
+    """
+    if not is_async_api_available() or len(calls) < 2:
+        return [getattr(api_survey_monkey, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+    # Built in the calling thread, so the access token is not requested in the event loop.
+    async_api_survey_monkey = AsyncApiSurveyMonkey(
+        api_survey_monkey.client_id,
+        api_survey_monkey.client.client_secret,
+        api_survey_monkey.surveymonkey_api_cache_duration,
+        api_survey_monkey.per_page,
+        async_client=get_pooled_async_client(api_survey_monkey.client_id, api_survey_monkey.client.client_secret),
+    )
+    timeout = getattr(settings, "SURVEYMONKEY_CONCURRENT_CALLS_TIMEOUT", DEFAULT_CONCURRENT_CALLS_TIMEOUT)
+
+    async def gather():
+        return await asyncio.gather(*[
+            getattr(async_api_survey_monkey, name)(*args, **kwargs) for name, args, kwargs in calls
+        ])
+
+    try:
+        return _run(gather(), timeout)
+    except FutureTimeoutError:
+        LOG.error("The %s concurrent SurveyMonkey calls did not finish in %s seconds", len(calls), timeout)
+        return [None] * len(calls)
+
+
+class AsyncApiSurveyMonkey(object):
+    """
+    Class with the necessary async methods to make request to surveymonkey API_BASE
+
+    It uses the given httpx.AsyncClient, or it must be used as an async context manager which
+    owns a new one:
+
+        async with AsyncApiSurveyMonkey(client_id, client_secret, cache_duration) as api:
+            surveys, details = await asyncio.gather(api.get_surveys(), api.get_survey_details(survey_id))
+
+    Synchronous code can use call_concurrently instead, which reuses a pooled client.
+    """
+    def __init__(self, client_id, client_secret, cache_duration, per_page=DEFAULT_PER_PAGE, async_client=None):
+        if not is_async_api_available():
+            raise ImportError("The httpx package is required to use AsyncApiSurveyMonkey.")
+
+        self.client = get_client(client_id, client_secret, cache_duration)
+        self.client_id = client_id
+        self.surveymonkey_api_cache_duration = cache_duration
+        self.per_page = per_page
+        self.async_client = async_client
+        self._owns_async_client = False
+
+        self.client.get_headers(cache_duration)
+
+    async def __aenter__(self):
+        if self.async_client is None:
+            self.async_client = build_async_client()
+            self._owns_async_client = True
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self._owns_async_client:
+            await self.async_client.aclose()
+            self.async_client = None
+            self._owns_async_client = False
+
+    async def _call_api(self, method, url, **kwargs):
+        response = await self.client.request_async(self.async_client, method, url, **kwargs)
+        LOG.info("Surveymonkey async %s response with status code = %s %s", method.upper(), response.status_code, url)
+        return response
+
+    async def _iter_pages(self, url, payload, per_page=None):
+        """
+        Yields the (status_code, page data) of every page of a list endpoint following links.next.
+
+        The iteration stops after the first page that is not successfully returned.
+        """
+        params = dict(payload)
+        params.setdefault("per_page", per_page or self.per_page)
+
+        while url:
+            response = await self._call_api("get", url, params=params)
+
+            if response.status_code != 200:
+                yield response.status_code, {}
+                return
+
+            page = response.json()
+            yield response.status_code, page
+
+            url = page.get("links", {}).get("next")
+            params = {}
+
+    async def _iter_items(self, url, payload, per_page, error_message, raise_errors=False):
+        """
+        Yields the data items of every page of a list endpoint, see ApiSurveyMonkey._iter_items.
+        """
+        async for status_code, page in self._iter_pages(url, payload, per_page):
+            if status_code != 200:
+                LOG.error(error_message, status_code)
+
+                if raise_errors:
+                    raise ApiSurveyMonkeyError(error_message % (status_code,))
+
+                return
+
+            for item in page.get("data", []):
+                yield item
+
+    async def _get_all_pages(self, url, payload, error_message):
+        """
+        Returns a dict with the data items of all the pages of a list endpoint, or an empty
+        dict if any page could not be returned.
+        """
+        data = []
+
+        async for status_code, page in self._iter_pages(url, payload):
+            if status_code != 200:
+                LOG.error(error_message, status_code)
+                return {}
+
+            data.extend(page.get("data", []))
+
+        return {
+            "data": data,
+            "total": len(data),
+        }
+
+    async def _get_cached(self, cache_key, fetch, *args):
+        """
+        Returns the cached value of cache_key, awaiting fetch(*args) to fill the cache when it is missing.
+
+        The stale values are returned as they are, ApiSurveyMonkey refreshes them. The cache
+        calls run in the executor of the loop, so a slow cache does not block the loop.
+        """
+        if not self.surveymonkey_api_cache_duration:
+            await run_blocking(cache.delete, cache_key)
+            return await fetch(*args)
+
+        cache_entry = await run_blocking(cache.get, cache_key)
+
+        if is_cache_entry(cache_entry):
+            return cache_entry["value"]
+
+        value = await fetch(*args)
+
+        if value:
+            await run_blocking(
+                cache.set,
+                cache_key,
+                build_cache_entry(value, self.surveymonkey_api_cache_duration),
+                self.surveymonkey_api_cache_duration,
+            )
+
+        return value
+
+    def iter_collector_responses(self, collector_id, per_page=None, raise_errors=False, **kwargs):
+        """
+        Async iterator of the full expanded responses of the collector, page by page.
+        """
+        url = "{}/v3/collectors/{}/responses/bulk".format(API_BASE, collector_id)
+        return self._iter_items(
+            url,
+            kwargs,
+            per_page,
+            "An error has ocurred trying to get collector responses = %s",
+            raise_errors,
+        )
+
+    async def get_collector_responses(self, collector_id, **kwargs):
+        """
+        Retrieves a list of full expanded responses, including answers to all questions.
+        """
+        url = "{}/v3/collectors/{}/responses/bulk".format(API_BASE, collector_id)
+        return await self._get_all_pages(url, kwargs, "An error has ocurred trying to get collector responses = %s")
+
+    def iter_surveys(self, per_page=None, raise_errors=False, **kwargs):
+        """
+        Async iterator of the surveys owned or shared with the authenticated user, page by page.
+        """
+        url = "{}/v3/surveys".format(API_BASE)
+        return self._iter_items(url, kwargs, per_page, "An error has ocurred trying to get surveys = %s", raise_errors)
+
+    async def get_surveys(self, **kwargs):
+        """
+        Returns a list of surveys owned or shared with the authenticated user, indexed by title.
+        """
+        return await self._get_cached(get_cache_key("all_surveys", self.client_id), self._fetch_surveys, kwargs)
+
+    async def _fetch_surveys(self, payload):
+        url = "{}/v3/surveys".format(API_BASE)
+        all_surveys_data = await self._get_all_pages(url, payload, "An error has ocurred trying to get surveys = %s")
+
+        if all_surveys_data:
+            all_surveys_data["title_index"] = build_survey_title_index(all_surveys_data["data"])
+
+        return all_surveys_data
+
+    async def get_surveys_by_title(self, title):
+        """
+        Returns the list of surveys with the given title.
+        """
+        all_surveys_data = await self.get_surveys()
+
+        if not all_surveys_data:
+            return []
+
+        title_index = all_surveys_data.get("title_index")
+
+        if title_index is None:
+            # Survey list cached before the title index was added.
+            title_index = build_survey_title_index(all_surveys_data.get("data", []))
+
+        return title_index.get(title, [])
+
+    def iter_collectors(self, survey_id, per_page=None, raise_errors=False, **kwargs):
+        """
+        Async iterator of the collectors of the given survey, page by page.
+        """
+        url = "{}/v3/surveys/{}/collectors".format(API_BASE, survey_id)
+        return self._iter_items(
+            url,
+            kwargs,
+            per_page,
+            "An error has ocurred trying to get collectors = %s",
+            raise_errors,
+        )
+
+    async def get_collectors(self, survey_id, **kwargs):
+        """
+        Returns a list of collectors for a given survey.
+        """
+        url = "{}/v3/surveys/{}/collectors".format(API_BASE, survey_id)
+        return await self._get_cached(
+            get_cache_key("all_collectors", self.client_id, survey_id, *get_payload_key_parts(kwargs)),
+            self._get_all_pages,
+            url,
+            kwargs,
+            "An error has ocurred trying to get collectors = %s",
+        )
+
+    async def get_survey_details(self, survey_id):
+        """
+        Returns the survey details for the given survey_id.
+        """
+        return await self._get_cached(
+            get_cache_key("survey_details", self.client_id, survey_id),
+            self._fetch_survey_details,
+            survey_id,
+        )
+
+    async def _fetch_survey_details(self, survey_id):
+        url = "{}/v3/surveys/{}/details".format(API_BASE, survey_id)
+        response = await self._call_api("get", url)
+
+        if response.status_code == 200:
+            return response.json()
+
+        LOG.error("An error has ocurred trying to get the survey details = %s", response.status_code)
+        return None
+
+    def iter_survey_responses(self, survey_id, per_page=None, raise_errors=False, **kwargs):
+        """
+        Async iterator of the bulk survey responses for the given survey_id, page by page.
+        """
+        url = "{}/v3/surveys/{}/responses/bulk".format(API_BASE, survey_id)
+        return self._iter_items(
+            url,
+            kwargs,
+            per_page,
+            "An error has ocurred trying to GET the survey responses: %s",
+            raise_errors,
+        )
+
+    async def get_survey_responses(self, survey_id, **kwargs):
+        """
+        Returns the bulk survey responses of all the pages for the given survey_id.
+        """
+        url = "{}/v3/surveys/{}/responses/bulk".format(API_BASE, survey_id)
+        return await self._get_all_pages(url, kwargs, "An error has ocurred trying to GET the survey responses: %s")
+
+    async def get_survey_response(self, survey_id, response_id, **kwargs):
+        """
+        Returns a response of the given survey_id.
+        """
+        url = "{}/v3/surveys/{}/responses/{}".format(API_BASE, survey_id, response_id)
+        response = await self._call_api("get", url, params=kwargs)
+
+        if response.status_code == 200:
+            return response.json()
+
+        LOG.error("An error has ocurred trying to GET the survey response: %s", response.status_code)
+        return {}
+
+    async def patch_question_data(self, survey_id, page_id, question_id, **kwargs):
+        """
+        Makes a PATCH request to update the question data.
+        """
+        url = "{}/v3/surveys/{}/pages/{}/questions/{}".format(API_BASE, survey_id, page_id, question_id)
+        response = await self._call_api("patch", url, json=kwargs)
+
+        if response.status_code == 200:
+            return response.json()
+
+        LOG.error("An error has ocurred trying to PATCH the question survey: %s", response.status_code)
+        return {}
@@ -0,0 +1,15 @@
+"""
+Django app of the surveymonkey XBlock, which provides its management commands and signal receivers.
+"""
+from django.apps import AppConfig
+
+
+class SurveyMonkeyConfig(AppConfig):
+    """
+    Registers the signal receivers of the surveymonkey app.
+    """
+    name = "surveymonkey"
+    verbose_name = "SurveyMonkey XBlock"
+
+    def ready(self):
+        from . import signals
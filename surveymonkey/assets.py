@@ -0,0 +1,72 @@
+"""
+Process-wide cache of the static assets and the compiled templates of the XBlock.
+
+The files are read from the package and the templates compiled once per process,
+instead of on every render.
+"""
+import hashlib
+import pkgutil
+import threading
+
+from django.template import Context, Template
+
+try:
+    from importlib.resources import files
+except ImportError:
+    # Python < 3.9, importlib.resources.files is not available.
+    files = None
+
+_RESOURCES = {}
+_RESOURCE_HASHES = {}
+_TEMPLATES = {}
+_LOCK = threading.Lock()
+
+
+def load_resource(path):
+    """
+    Returns the decoded content of the package file in path.
+    """
+    resource = _RESOURCES.get(path)
+
+    if resource is None:
+        if files is not None:
+            data = files(__package__).joinpath(path).read_bytes()
+        else:
+            data = pkgutil.get_data(__package__, path)
+
+        resource = data.decode("utf8")
+
+        with _LOCK:
+            _RESOURCES[path] = resource
+
+    return resource
+
+
+def get_resource_hash(path):
+    """
+    Returns a short hash of the content of the package file in path, e.g. to version its url.
+    """
+    resource_hash = _RESOURCE_HASHES.get(path)
+
+    if resource_hash is None:
+        resource_hash = hashlib.sha1(load_resource(path).encode("utf8")).hexdigest()[:12]
+
+        with _LOCK:
+            _RESOURCE_HASHES[path] = resource_hash
+
+    return resource_hash
+
+
+def render_template(path, context):
+    """
+    Renders the Django template in path with the given context dict.
+    """
+    template = _TEMPLATES.get(path)
+
+    if template is None:
+        template = Template(load_resource(path))
+
+        with _LOCK:
+            _TEMPLATES[path] = template
+
+    return template.render(Context(context))
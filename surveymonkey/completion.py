@@ -0,0 +1,414 @@
+"""
+Cache of the completion status of the surveymonkey student items.
+
+The completion is stored per student item, so the student views do not query the submissions
+on every render, and it can be loaded for several blocks with a single query.
+"""
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from submissions import api as submissions_api
+from submissions.models import Submission
+
+from .jobs import SUBMISSIONS_JOB_QUEUE, get_job_queue
+
+LOG = logging.getLogger(__name__)
+
+SURVEY_MONKEY_COMPLETION_TAG = "surveymonkey_completion"
+ITEM_TYPE = "surveymonkey"
+# A completed survey does not change, but the pending ones are checked again after a few minutes
+# in case the submission was created by another process.
+COMPLETED_CACHE_TIMEOUT = 60 * 60 * 24
+NOT_COMPLETED_CACHE_TIMEOUT = 60 * 5
+# Maximum number of student items looked up per cache and submissions query by bulk_load_completion.
+BULK_COMPLETION_CHUNK_SIZE = 1000
+# Seconds a student item is locked while its completion submission is created.
+SUBMISSION_LOCK_TIMEOUT = 60
+DEFAULT_SUBMISSION_BATCH_SIZE = 100
+# Number of flushes a buffered submission is written in before it is dropped.
+MAX_SUBMISSION_ATTEMPTS = 3
+COMPLETION_ANSWER = {"survey_completed": True}
+
+
+def get_completion_cache_key(student_id, course_id, item_id):
+    """
+    Returns the cache key of the completion of a student item.
+    """
+    return "{}-{}-{}-{}".format(SURVEY_MONKEY_COMPLETION_TAG, course_id, item_id, student_id)
+
+
+def get_cached_completion(student_item):
+    """
+    Returns True or False if the completion of the student item is cached, None otherwise.
+    """
+    return cache.get(get_completion_cache_key(
+        student_item["student_id"],
+        student_item["course_id"],
+        student_item["item_id"],
+    ))
+
+
+def set_cached_completion(student_item, completed):
+    """
+    Stores the completion of the student item.
+    """
+    cache.set(
+        get_completion_cache_key(student_item["student_id"], student_item["course_id"], student_item["item_id"]),
+        completed,
+        COMPLETED_CACHE_TIMEOUT if completed else NOT_COMPLETED_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_completion(student_item):
+    """
+    Removes the cached completion of the student item.
+    """
+    cache.delete(get_completion_cache_key(
+        student_item["student_id"],
+        student_item["course_id"],
+        student_item["item_id"],
+    ))
+
+
+def preload_completion(student_id, course_id, item_ids):
+    """
+    Loads and caches the completion of the student for all the given surveymonkey blocks.
+
+    Args:
+        student_id: Anonymous student id.
+        course_id: Course id string.
+        item_ids: Block ids of the surveymonkey blocks, e.g. all the blocks of a unit.
+    Returns:
+        Dict: Completion of every item id.
+    """
+    completed_item_ids = set(
+        Submission.objects.filter(
+            student_item__student_id=student_id,
+            student_item__course_id=course_id,
+            student_item__item_type=ITEM_TYPE,
+            student_item__item_id__in=list(item_ids),
+            status=Submission.ACTIVE,
+        ).values_list("student_item__item_id", flat=True)
+    )
+    completions = {item_id: item_id in completed_item_ids for item_id in item_ids}
+
+    for completed in (True, False):
+        cache.set_many(
+            {
+                get_completion_cache_key(student_id, course_id, item_id): completed
+                for item_id, item_completed in completions.items()
+                if item_completed is completed
+            },
+            COMPLETED_CACHE_TIMEOUT if completed else NOT_COMPLETED_CACHE_TIMEOUT,
+        )
+
+    return completions
+
+
+def get_completed_student_ids(course_id, item_id, student_ids):
+    """
+    Returns the set of the given anonymous student ids that already completed the surveymonkey block.
+    """
+    return set(
+        Submission.objects.filter(
+            student_item__student_id__in=list(student_ids),
+            student_item__course_id=course_id,
+            student_item__item_type=ITEM_TYPE,
+            student_item__item_id=item_id,
+            status=Submission.ACTIVE,
+        ).values_list("student_item__student_id", flat=True)
+    )
+
+
+def set_cached_completions(course_id, item_id, student_ids):
+    """
+    Stores the given anonymous student ids as completed for the surveymonkey block.
+    """
+    cache.set_many(
+        {get_completion_cache_key(student_id, course_id, item_id): True for student_id in student_ids},
+        COMPLETED_CACHE_TIMEOUT,
+    )
+
+
+def bulk_load_completion(course_id, item_ids, student_ids, chunk_size=BULK_COMPLETION_CHUNK_SIZE):
+    """
+    Returns the completion of the given students for the given surveymonkey blocks.
+
+    The student items are read from the cache in chunks, and the ones not cached are loaded
+    with a single submissions query per chunk of students and cached.
+
+    Args:
+        course_id: Course id string.
+        item_ids: Block ids of the surveymonkey blocks.
+        student_ids: Anonymous student ids.
+        chunk_size: Maximum number of student items per chunk.
+    Returns:
+        Dict: Set of the student ids that completed every item id.
+    """
+    item_ids = list(item_ids)
+    student_ids = list(student_ids)
+    completions = {item_id: set() for item_id in item_ids}
+
+    if not item_ids:
+        return completions
+
+    students_per_chunk = max(chunk_size // len(item_ids), 1)
+
+    for start in range(0, len(student_ids), students_per_chunk):
+        student_items = {
+            get_completion_cache_key(student_id, course_id, item_id): (item_id, student_id)
+            for student_id in student_ids[start:start + students_per_chunk]
+            for item_id in item_ids
+        }
+        cached_completions = cache.get_many(list(student_items))
+        missing_keys = []
+
+        for key, (item_id, student_id) in student_items.items():
+            completed = cached_completions.get(key)
+
+            if completed is None:
+                missing_keys.append(key)
+            elif completed:
+                completions[item_id].add(student_id)
+
+        if not missing_keys:
+            continue
+
+        completed_student_items = set(
+            Submission.objects.filter(
+                student_item__student_id__in=list({student_items[key][1] for key in missing_keys}),
+                student_item__course_id=course_id,
+                student_item__item_type=ITEM_TYPE,
+                student_item__item_id__in=list({student_items[key][0] for key in missing_keys}),
+                status=Submission.ACTIVE,
+            ).values_list("student_item__item_id", "student_item__student_id")
+        )
+        new_completions = {True: {}, False: {}}
+
+        for key in missing_keys:
+            completed = student_items[key] in completed_student_items
+            new_completions[completed][key] = completed
+
+            if completed:
+                completions[student_items[key][0]].add(student_items[key][1])
+
+        for completed, values in new_completions.items():
+            cache.set_many(values, COMPLETED_CACHE_TIMEOUT if completed else NOT_COMPLETED_CACHE_TIMEOUT)
+
+    return completions
+
+
+def create_completion_submission(student_item):
+    """
+    Creates the completion submission of the student item, unless it already exists.
+
+    The submission is not created if the completion is cached, if another request is creating
+    it or if an active submission exists, so repeated confirmations write a single row.
+
+    Returns:
+        Boolean: True if the submission was created.
+    """
+    if get_cached_completion(student_item):
+        return False
+
+    lock_key = "{}-{}".format(
+        get_completion_cache_key(student_item["student_id"], student_item["course_id"], student_item["item_id"]),
+        "lock",
+    )
+
+    if not cache.add(lock_key, True, SUBMISSION_LOCK_TIMEOUT):
+        return False
+
+    try:
+        if get_completed_student_ids(student_item["course_id"], student_item["item_id"], [student_item["student_id"]]):
+            set_cached_completion(student_item, True)
+            return False
+
+        submissions_api.create_submission(student_item, COMPLETION_ANSWER)
+        set_cached_completion(student_item, True)
+    finally:
+        cache.delete(lock_key)
+
+    return True
+
+
+class SubmissionBuffer(object):
+    """
+    Write-behind buffer of completion submissions, flushed in batches by the submissions job queue.
+
+    The completion is cached as soon as a student item is added, so the learner sees the survey
+    as completed, and the buffered student items are written after the flush delay. Buffered
+    submissions are lost if the process stops before the flush, but they are recorded again by
+    the SurveyMonkey webhooks or the reconcile_surveymonkey_completions command.
+    """
+    def __init__(self, delay, batch_size=DEFAULT_SUBMISSION_BATCH_SIZE):
+        self.delay = delay
+        self.batch_size = batch_size
+        self._student_items = OrderedDict()
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def add(self, student_item):
+        """
+        Buffers the completion submission of the student item, unless it is already completed.
+        """
+        if get_cached_completion(student_item):
+            return None
+
+        key = get_completion_cache_key(student_item["student_id"], student_item["course_id"], student_item["item_id"])
+
+        with self._lock:
+            self._student_items[key] = dict(student_item)
+
+        set_cached_completion(student_item, True)
+        get_job_queue(SUBMISSIONS_JOB_QUEUE).enqueue("flush_submissions", self.flush)
+        return None
+
+    def flush(self):
+        """
+        Writes the buffered submissions after the flush delay, batch_size student items per transaction.
+
+        The student items of a failed transaction are written one by one, and the ones that still
+        fail are buffered again for the next flush, up to MAX_SUBMISSION_ATTEMPTS times.
+        """
+        time.sleep(self.delay)
+        failed_student_items = OrderedDict()
+
+        while True:
+            with self._lock:
+                keys = list(self._student_items)[:self.batch_size]
+                student_items = OrderedDict((key, self._student_items.pop(key)) for key in keys)
+
+            if not student_items:
+                break
+
+            try:
+                self._write(list(student_items.values()))
+            except Exception:
+                LOG.exception(
+                    "Error writing %s buffered surveymonkey submissions, writing them one by one",
+                    len(student_items),
+                )
+                failed_student_items.update(self._write_one_by_one(student_items))
+
+            with self._lock:
+                for key in student_items:
+                    if key not in failed_student_items:
+                        self._attempts.pop(key, None)
+
+        if failed_student_items:
+            self._buffer_again(failed_student_items)
+
+        return None
+
+    @staticmethod
+    def _write_one_by_one(student_items):
+        """
+        Creates the submissions of the student items one at a time.
+
+        Returns:
+            OrderedDict: The student items whose submission could not be created, by key.
+        """
+        failed_student_items = OrderedDict()
+
+        for key, student_item in student_items.items():
+            # The completion was cached when the student item was buffered.
+            invalidate_completion(student_item)
+
+            try:
+                create_completion_submission(student_item)
+            except Exception:
+                LOG.exception("Error writing the buffered surveymonkey submission %s", key)
+                failed_student_items[key] = student_item
+
+        return failed_student_items
+
+    def _buffer_again(self, student_items):
+        """
+        Adds the failed student items back to the buffer, or drops the ones that failed too many times.
+        """
+        buffered = False
+
+        for key, student_item in student_items.items():
+            with self._lock:
+                attempts = self._attempts.pop(key, 0) + 1
+
+                if attempts < MAX_SUBMISSION_ATTEMPTS:
+                    self._attempts[key] = attempts
+                    self._student_items.setdefault(key, student_item)
+
+            if attempts < MAX_SUBMISSION_ATTEMPTS:
+                set_cached_completion(student_item, True)
+                buffered = True
+            else:
+                LOG.error("The buffered surveymonkey submission %s is dropped after %s attempts", key, attempts)
+                invalidate_completion(student_item)
+
+        if buffered:
+            get_job_queue(SUBMISSIONS_JOB_QUEUE).enqueue("flush_submissions", self.flush)
+
+    @staticmethod
+    def _write(student_items):
+        """
+        Creates the submissions of the student items that do not have one, in a single transaction.
+        """
+        items_by_block = OrderedDict()
+
+        for student_item in student_items:
+            items_by_block.setdefault((student_item["course_id"], student_item["item_id"]), []).append(student_item)
+
+        with transaction.atomic():
+            for (course_id, item_id), block_items in items_by_block.items():
+                completed_student_ids = get_completed_student_ids(
+                    course_id,
+                    item_id,
+                    [student_item["student_id"] for student_item in block_items],
+                )
+
+                for student_item in block_items:
+                    if student_item["student_id"] not in completed_student_ids:
+                        submissions_api.create_submission(student_item, COMPLETION_ANSWER)
+                        completed_student_ids.add(student_item["student_id"])
+
+
+_SUBMISSION_BUFFER = None
+_SUBMISSION_BUFFER_LOCK = threading.Lock()
+
+
+def get_submission_buffer():
+    """
+    Returns the process-wide SubmissionBuffer, or None if SURVEYMONKEY_SUBMISSION_BUFFER_DELAY is not set.
+    """
+    global _SUBMISSION_BUFFER
+
+    delay = getattr(settings, "SURVEYMONKEY_SUBMISSION_BUFFER_DELAY", 0)
+
+    if not delay:
+        return None
+
+    with _SUBMISSION_BUFFER_LOCK:
+        if _SUBMISSION_BUFFER is None:
+            _SUBMISSION_BUFFER = SubmissionBuffer(
+                delay,
+                getattr(settings, "SURVEYMONKEY_SUBMISSION_BATCH_SIZE", DEFAULT_SUBMISSION_BATCH_SIZE),
+            )
+
+    return _SUBMISSION_BUFFER
+
+
+def record_completion_submission(student_item):
+    """
+    Records the completion of the student item, buffered if the submission buffer is enabled.
+    """
+    submission_buffer = get_submission_buffer()
+
+    if submission_buffer is not None:
+        submission_buffer.add(student_item)
+    else:
+        create_completion_submission(student_item)
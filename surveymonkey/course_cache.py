@@ -0,0 +1,72 @@
+"""
+Cache of the course fields used by the completion and confirmation pages of the surveymonkey blocks.
+
+The pages only need a few fields of the course, so they are cached per course instead of loading
+the course from the modulestore on every request. The cache is invalidated when the course is
+published, see signals.py.
+"""
+from django.core.cache import cache
+from six import text_type
+
+SURVEY_MONKEY_COURSE_TAG = "surveymonkey_course"
+COURSE_CACHE_TIMEOUT = 60 * 60 * 24
+# Course fields used by the header of the completion page.
+COURSE_FIELDS = (
+    "display_name",
+    "display_name_with_default",
+    "display_org_with_default",
+    "display_number_with_default",
+    "org",
+    "number",
+)
+
+
+def get_course_by_id(course_key):
+    """
+    Returns the course descriptor, importing the modulestore helpers only when a handler needs them.
+    """
+    from openedx.core.lib.courses import get_course_by_id as get_course
+
+    return get_course(course_key)
+
+
+class CachedCourse(object):
+    """
+    Cached fields of a course, usable in the templates in place of the course descriptor.
+    """
+    def __init__(self, course_key, course_data):
+        self.id = course_key
+        self.external_course_target = course_data.get("external_course_target")
+
+        for field in COURSE_FIELDS:
+            setattr(self, field, course_data.get(field))
+
+
+def get_course_cache_key(course_key):
+    """
+    Returns the cache key of the fields of a course.
+    """
+    return "{}-{}".format(SURVEY_MONKEY_COURSE_TAG, text_type(course_key))
+
+
+def get_cached_course(course_key):
+    """
+    Returns the CachedCourse of course_key, loading the course from the modulestore if it is not cached.
+    """
+    cache_key = get_course_cache_key(course_key)
+    course_data = cache.get(cache_key)
+
+    if course_data is None:
+        course = get_course_by_id(course_key)
+        course_data = {field: text_type(getattr(course, field, "")) for field in COURSE_FIELDS}
+        course_data["external_course_target"] = (course.other_course_settings or {}).get("external_course_target")
+        cache.set(cache_key, course_data, COURSE_CACHE_TIMEOUT)
+
+    return CachedCourse(course_key, course_data)
+
+
+def invalidate_course(course_key):
+    """
+    Removes the cached fields of a course, e.g. after it was published.
+    """
+    cache.delete(get_course_cache_key(course_key))
@@ -0,0 +1,74 @@
+"""
+Cache of the rendered student view fragments of the surveymonkey blocks.
+
+The student view is the same for every learner that completed the survey, and for every learner
+of a block that is not trackable, so it is rendered once and then read from the cache. The keys
+include a hash of the block settings and of the static assets, so the fragments cached before
+the block is saved in Studio or the XBlock is upgraded are not used.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.utils import translation
+from web_fragments.fragment import Fragment
+
+from .assets import get_resource_hash
+
+SURVEY_MONKEY_FRAGMENT_TAG = "surveymonkey_fragment"
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+# The fragments with the headings of the previous survey responses are refreshed sooner, in case
+# the learner changes those responses.
+PERSONALIZED_FRAGMENT_CACHE_TIMEOUT = 60 * 5
+
+
+def get_settings_hash(settings, asset_paths):
+    """
+    Returns the hash of the settings of a block and of the static assets used by its view.
+
+    Args:
+        settings: Dict with the JSON values of the settings fields of the block.
+        asset_paths: Package paths of the templates, CSS and JS of the view.
+    """
+    data = json.dumps(settings, sort_keys=True, default=str)
+    data += "".join(get_resource_hash(path) for path in asset_paths)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def get_fragment_cache_key(usage_key, settings_hash, completed, uid=None):
+    """
+    Returns the cache key of a student view fragment.
+
+    Args:
+        usage_key: Usage key of the block.
+        settings_hash: Hash returned by get_settings_hash.
+        completed: True if the learner completed the survey.
+        uid: Anonymous id of the learner, only for the fragments that depend on the learner.
+    """
+    key_data = "-".join([
+        str(usage_key),
+        settings_hash,
+        translation.get_language() or "",
+        str(int(bool(completed))),
+        uid or "",
+    ])
+    return "{}-{}".format(SURVEY_MONKEY_FRAGMENT_TAG, hashlib.sha1(key_data.encode("utf-8")).hexdigest())
+
+
+def get_cached_fragment(cache_key):
+    """
+    Returns the cached Fragment of cache_key, or None if it is not cached.
+    """
+    fragment_data = cache.get(cache_key)
+
+    if fragment_data is None:
+        return None
+
+    return Fragment.from_dict(fragment_data)
+
+
+def set_cached_fragment(cache_key, fragment, timeout=FRAGMENT_CACHE_TIMEOUT):
+    """
+    Stores the Fragment in cache_key.
+    """
+    cache.set(cache_key, fragment.to_dict(), timeout)
@@ -0,0 +1,119 @@
+"""
+Compiled templates of the question headings written in the overwritten_question_headings field.
+
+Every line of the field is a question heading where {question heading} is replaced by the
+user's answer to that question of the previous survey. The field is parsed once per process
+and value, and the headings are rendered in a single pass with a dict lookup per placeholder.
+
+Syntax:
+    {question heading}: The answer, left as written if the question was not answered.
+    {question heading|default}: The answer, or default if the question was not answered.
+    {{ and }}: Literal { and }.
+"""
+import hashlib
+import re
+import threading
+
+PLACEHOLDER_PATTERN = re.compile(r"\{\{|\}\}|\{([^{}]*)\}")
+DEFAULT_SEPARATOR = "|"
+MAX_CACHED_TEMPLATES = 1000
+ESCAPES = {"{{": "{", "}}": "}"}
+
+_TEMPLATES = {}
+_LOCK = threading.Lock()
+
+
+class Placeholder(object):
+    """
+    {question heading} or {question heading|default} placeholder of a heading template.
+    """
+    def __init__(self, raw, name):
+        self.raw = raw
+        self.name = name
+        self.default_name = None
+        self.default = None
+
+        if DEFAULT_SEPARATOR in name:
+            self.default_name, self.default = name.rsplit(DEFAULT_SEPARATOR, 1)
+
+    def render(self, answers):
+        """
+        Returns the answer of the placeholder question, its default or the placeholder as written.
+
+        The whole name is looked up first, so question headings containing the separator still match.
+        """
+        answer = answers.get(self.name)
+
+        if answer is not None:
+            return answer
+
+        if self.default_name is not None:
+            answer = answers.get(self.default_name)
+            return self.default if answer is None else answer
+
+        return self.raw
+
+
+class HeadingTemplate(object):
+    """
+    Question heading parsed into literal strings and placeholders.
+    """
+    def __init__(self, heading):
+        self.heading = heading
+        self.parts = []
+        literal = []
+        position = 0
+
+        for match in PLACEHOLDER_PATTERN.finditer(heading):
+            literal.append(heading[position:match.start()])
+            position = match.end()
+
+            if match.group(1) is None:
+                literal.append(ESCAPES[match.group(0)])
+                continue
+
+            self.parts.append("".join(literal))
+            self.parts.append(Placeholder(match.group(0), match.group(1)))
+            literal = []
+
+        literal.append(heading[position:])
+        self.parts.append("".join(literal))
+
+    def render(self, answers):
+        """
+        Returns the heading with its placeholders replaced.
+
+        Args:
+            answers: Dict of question heading to the user's answer.
+        """
+        return "".join(part if isinstance(part, str) else part.render(answers) for part in self.parts)
+
+
+def compile_headings(text):
+    """
+    Returns the HeadingTemplate of every non blank line of text, parsed once per process.
+    """
+    key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    templates = _TEMPLATES.get(key)
+
+    if templates is None:
+        templates = [HeadingTemplate(heading) for heading in text.splitlines() if heading]
+
+        with _LOCK:
+            if len(_TEMPLATES) >= MAX_CACHED_TEMPLATES:
+                _TEMPLATES.clear()
+
+            _TEMPLATES[key] = templates
+
+    return templates
+
+
+def render_headings(text, answers):
+    """
+    Returns the question headings of text with their placeholders replaced by the answers.
+
+    Args:
+        text: Value of the overwritten_question_headings field.
+        answers: Dict of question heading to the user's answer.
+    """
+    return [template.render(answers) for template in compile_headings(text)]
@@ -0,0 +1,169 @@
+"""
+In-process background job queues used to keep the SurveyMonkey API calls out of the render path.
+"""
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .metrics import get_metrics
+
+LOG = logging.getLogger(__name__)
+DEFAULT_JOB_QUEUE_SIZE = 100
+DEFAULT_JOB_QUEUE_WORKERS = 2
+HEADINGS_JOB_QUEUE = "question_headings"
+CACHE_REFRESH_JOB_QUEUE = "cache_refresh"
+WEBHOOK_JOB_QUEUE = "webhook_events"
+SUBMISSIONS_JOB_QUEUE = "submissions"
+
+
+class JobQueue(object):
+    """
+    Bounded queue of keyed jobs processed by a small pool of daemon worker threads.
+
+    Jobs enqueued with a key that is already pending are coalesced: the pending job is
+    replaced by the new one, so only the latest version of a write is sent.
+    """
+    def __init__(self, name, max_size=DEFAULT_JOB_QUEUE_SIZE, workers=DEFAULT_JOB_QUEUE_WORKERS):
+        self.name = name
+        self.max_size = max_size
+        self.workers = workers
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "processed": 0,
+            "failed": 0,
+            "total_latency": 0.0,
+            "last_latency": 0.0,
+        }
+
+    def enqueue(self, key, func, *args, **kwargs):
+        """
+        Adds a job to the queue and returns immediately.
+
+        Args:
+            key: Hashable job identifier, used to coalesce duplicated jobs.
+            func: Callable to run in a worker thread.
+            args, kwargs: Arguments passed to func.
+        Returns:
+            Boolean: False if the job was dropped because the queue is full.
+        """
+        with self._condition:
+            if key in self._pending:
+                self._pending[key] = (func, args, kwargs)
+                self._stats["coalesced"] += 1
+                return True
+
+            if len(self._pending) >= self.max_size:
+                self._stats["dropped"] += 1
+                get_metrics().increment("surveymonkey.jobs.dropped", tags={"queue": self.name})
+                LOG.warning("The %s job queue is full, dropping job %s", self.name, key)
+                return False
+
+            self._pending[key] = (func, args, kwargs)
+            self._stats["enqueued"] += 1
+            self._start_workers()
+            self._condition.notify()
+            depth = len(self._pending)
+
+        get_metrics().gauge("surveymonkey.jobs.depth", depth, tags={"queue": self.name})
+
+        return True
+
+    def stats(self):
+        """
+        Returns a dict with the queue depth and the job latency metrics of the queue.
+        """
+        with self._condition:
+            stats = dict(self._stats, depth=len(self._pending))
+
+        processed = stats["processed"] + stats["failed"]
+        stats["average_latency"] = stats["total_latency"] / processed if processed else 0.0
+        return stats
+
+    def _start_workers(self):
+        """
+        Starts the worker threads the first time a job is enqueued. Must be called holding the lock.
+        """
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+
+        for index in range(len(self._threads), self.workers):
+            thread = threading.Thread(
+                target=self._work,
+                name="{}-worker-{}".format(self.name, index),
+            )
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        """
+        Worker loop, runs the pending jobs in FIFO order.
+        """
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+                key, (func, args, kwargs) = self._pending.popitem(last=False)
+
+            start = time.time()
+            # The worker threads outlive the requests, so their database connections are not
+            # closed by the request signals and they can be stale between the jobs.
+            close_old_connections()
+
+            try:
+                func(*args, **kwargs)
+                status = "processed"
+            except Exception:
+                LOG.exception("Error running the %s job %s", self.name, key)
+                status = "failed"
+            finally:
+                close_old_connections()
+
+            latency = time.time() - start
+
+            with self._condition:
+                self._stats[status] += 1
+                self._stats["total_latency"] += latency
+                self._stats["last_latency"] = latency
+                depth = len(self._pending)
+
+            metrics = get_metrics()
+            metrics.gauge("surveymonkey.jobs.depth", depth, tags={"queue": self.name})
+            metrics.timing("surveymonkey.jobs.duration", latency * 1000, tags={"queue": self.name, "status": status})
+            LOG.info(
+                "Surveymonkey %s job %s %s in %.3f seconds, queue depth = %s",
+                self.name,
+                key,
+                status,
+                latency,
+                depth,
+            )
+
+
+_JOB_QUEUES = {}
+_JOB_QUEUES_LOCK = threading.Lock()
+
+
+def get_job_queue(name):
+    """
+    Returns the process-wide job queue with the given name, creating it on first use.
+    """
+    with _JOB_QUEUES_LOCK:
+        if name not in _JOB_QUEUES:
+            _JOB_QUEUES[name] = JobQueue(
+                name,
+                max_size=getattr(settings, "SURVEYMONKEY_JOB_QUEUE_SIZE", DEFAULT_JOB_QUEUE_SIZE),
+                workers=getattr(settings, "SURVEYMONKEY_JOB_QUEUE_WORKERS", DEFAULT_JOB_QUEUE_WORKERS),
+            )
+
+    return _JOB_QUEUES[name]
@@ -0,0 +1,171 @@
+"""
+Records the completion of the learners that answered the surveys of the surveymonkey blocks.
+
+The responses of the weblink collectors are read since the last reconciliation and a submission
+is created for every learner identified by the uid custom variable that has not completed
+the block yet.
+
+Example:
+    ./manage.py lms reconcile_surveymonkey_completions course-v1:edX+DemoX+Demo_Course
+"""
+import logging
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from opaque_keys.edx.keys import CourseKey
+from six import text_type
+from submissions import api as submissions_api
+from xmodule.modulestore.django import modulestore
+
+from surveymonkey.api_surveymonkey import COLLECTORS_INCLUDE, ApiSurveyMonkey
+from surveymonkey.completion import ITEM_TYPE, get_completed_student_ids, set_cached_completions
+
+try:
+    from common.djangoapps.student.models import AnonymousUserId
+except ImportError:
+    from student.models import AnonymousUserId
+
+LOG = logging.getLogger(__name__)
+SURVEY_MONKEY_RECONCILIATION_TAG = "surveymonkey_reconciliation"
+DEFAULT_BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+    """
+    Creates the missing surveymonkey submissions from the SurveyMonkey collector responses.
+    """
+    help = "Creates the missing surveymonkey submissions from the SurveyMonkey collector responses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("course_ids", nargs="+", help="Ids of the courses to reconcile.")
+        parser.add_argument(
+            "--since",
+            default=None,
+            help="Reconcile the responses modified since this YYYY-MM-DDTHH:MM:SS date instead of the last run.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Number of responses processed per database transaction.",
+        )
+
+    def handle(self, *args, **options):
+        for course_id in options["course_ids"]:
+            course_key = CourseKey.from_string(course_id)
+            blocks = modulestore().get_items(course_key, qualifiers={"category": ITEM_TYPE})
+
+            for block in blocks:
+                created = self.reconcile_block(block, options["since"], options["batch_size"])
+                LOG.info(
+                    "Surveymonkey reconciliation created %s submissions for the block %s",
+                    created,
+                    text_type(block.location),
+                )
+
+    def reconcile_block(self, block, since, batch_size):
+        """
+        Creates the missing submissions of the block from the responses of its weblink collectors.
+
+        Returns:
+            Integer: Number of created submissions.
+        """
+        if not (block.client_id and block.client_secret and block.survey_id):
+            return 0
+
+        api_survey_monkey = ApiSurveyMonkey(
+            block.client_id,
+            block.client_secret,
+            block.surveymonkey_api_cache_duration,
+        )
+        collectors = api_survey_monkey.get_collectors(
+            block.survey_id,
+            **{"include": COLLECTORS_INCLUDE}
+        )
+        created = 0
+
+        for collector in collectors.get("data", []):
+            if collector.get("type") != "weblink":
+                continue
+
+            created += self.reconcile_collector(api_survey_monkey, block, collector.get("id"), since, batch_size)
+
+        return created
+
+    def reconcile_collector(self, api_survey_monkey, block, collector_id, since, batch_size):
+        """
+        Streams the completed responses of the collector modified since the watermark and
+        creates their submissions in batches.
+        """
+        course_id = text_type(block.location.course_key)
+        item_id = block.location.block_id
+        watermark_key = "{}-{}-{}-{}".format(SURVEY_MONKEY_RECONCILIATION_TAG, course_id, item_id, collector_id)
+        watermark = since or cache.get(watermark_key)
+        kwargs = {
+            "simple": "true",
+            "status": "completed",
+            "sort_by": "date_modified",
+            "sort_order": "ASC",
+        }
+
+        if watermark:
+            kwargs["start_modified_at"] = watermark
+
+        created = 0
+        uids = set()
+
+        for response in api_survey_monkey.iter_collector_responses(collector_id, **kwargs):
+            uid = response.get("custom_variables", {}).get("uid")
+            date_modified = response.get("date_modified", "")
+
+            if uid:
+                uids.add(uid)
+
+            if date_modified:
+                watermark = max(watermark or "", date_modified[:19])
+
+            if len(uids) >= batch_size:
+                created += self.create_submissions(course_id, item_id, uids)
+                cache.set(watermark_key, watermark, None)
+                uids = set()
+
+        if uids:
+            created += self.create_submissions(course_id, item_id, uids)
+
+        if watermark:
+            cache.set(watermark_key, watermark, None)
+
+        return created
+
+    def create_submissions(self, course_id, item_id, uids):
+        """
+        Creates the submissions of the learners of the course with the given anonymous ids that
+        did not complete the block yet.
+        """
+        # The anonymous ids are per course, and a collector can be shared by the blocks of several courses.
+        student_ids = set(
+            AnonymousUserId.objects.filter(
+                anonymous_user_id__in=list(uids),
+                course_id=CourseKey.from_string(course_id),
+            ).values_list("anonymous_user_id", flat=True)
+        )
+        student_ids -= get_completed_student_ids(course_id, item_id, student_ids)
+
+        if not student_ids:
+            return 0
+
+        with transaction.atomic():
+            for student_id in student_ids:
+                submissions_api.create_submission(
+                    {
+                        "student_id": student_id,
+                        "course_id": course_id,
+                        "item_id": item_id,
+                        "item_type": ITEM_TYPE,
+                    },
+                    {"survey_completed": True},
+                )
+
+        set_cached_completions(course_id, item_id, student_ids)
+        return len(student_ids)
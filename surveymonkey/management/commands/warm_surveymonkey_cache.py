@@ -0,0 +1,84 @@
+"""
+Prefetches the SurveyMonkey data used by the surveymonkey blocks of the given courses.
+
+The surveys, collectors, survey details and previous survey response indexes are cached by
+survey, so every survey is fetched once even if it is used by several blocks. The local response
+store is also updated when SURVEYMONKEY_RESPONSE_STORE_PATH is set.
+
+Example:
+    ./manage.py lms warm_surveymonkey_cache course-v1:edX+DemoX+Demo_Course
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+from opaque_keys.edx.keys import CourseKey
+from xmodule.modulestore.django import modulestore
+
+from surveymonkey.api_surveymonkey import COLLECTORS_INCLUDE, ApiSurveyMonkey
+from surveymonkey.completion import ITEM_TYPE
+from surveymonkey.response_store import get_response_store
+
+LOG = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Warms up the SurveyMonkey cache of the surveymonkey blocks of the given courses.
+    """
+    help = "Warms up the SurveyMonkey cache of the surveymonkey blocks of the given courses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("course_ids", nargs="+", help="Ids of the courses to warm up.")
+
+    def handle(self, *args, **options):
+        surveys = {}
+
+        for course_id in options["course_ids"]:
+            course_key = CourseKey.from_string(course_id)
+
+            for block in modulestore().get_items(course_key, qualifiers={"category": ITEM_TYPE}):
+                if not (block.client_id and block.client_secret and block.survey_id):
+                    continue
+
+                client_surveys = surveys.setdefault(
+                    (block.client_id, block.client_secret, block.surveymonkey_api_cache_duration),
+                    {"surveys": set(), "previous_surveys": set()},
+                )
+                client_surveys["surveys"].add(block.survey_id)
+
+                if block.overwrite_survey_questions and block.previous_survey_id:
+                    client_surveys["previous_surveys"].add(block.previous_survey_id)
+
+        for (client_id, client_secret, cache_duration), client_surveys in surveys.items():
+            self.warm_client(
+                ApiSurveyMonkey(client_id, client_secret, cache_duration),
+                client_surveys["surveys"],
+                client_surveys["previous_surveys"],
+            )
+
+    def warm_client(self, api_survey_monkey, survey_ids, previous_survey_ids):
+        """
+        Fetches the data of the given surveys of a SurveyMonkey client in one concurrent pass.
+        """
+        calls = [("get_surveys", (), {})]
+
+        for survey_id in survey_ids:
+            calls.append(("get_collectors", (survey_id,), {"include": COLLECTORS_INCLUDE}))
+            calls.append(("get_survey_details", (survey_id,), {}))
+
+        api_survey_monkey.call_concurrently(calls)
+
+        response_store = get_response_store()
+
+        for previous_survey_id in previous_survey_ids:
+            api_survey_monkey.refresh_response_index(previous_survey_id)
+
+            if response_store is not None:
+                response_store.sync(api_survey_monkey, previous_survey_id, min_interval=0)
+
+        LOG.info(
+            "Surveymonkey cache warmed up for %s surveys and %s previous surveys of the client %s",
+            len(survey_ids),
+            len(previous_survey_ids),
+            api_survey_monkey.client_id,
+        )
@@ -0,0 +1,122 @@
+"""
+Pluggable metrics of the SurveyMonkey API calls, caches, job queues and renders.
+
+The metrics are discarded by default. Set SURVEYMONKEY_METRICS_BACKEND to the dotted path
+of a Metrics subclass to send them to statsd, Prometheus or any other system, e.g.:
+
+    SURVEYMONKEY_METRICS_BACKEND = "surveymonkey.metrics.StatsdMetrics"
+"""
+import functools
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+NUMERIC_PATH_SEGMENT = re.compile(r"/\d+")
+
+
+class Metrics(object):
+    """
+    Metrics interface, every method does nothing. Timings are in milliseconds.
+    """
+    def increment(self, name, value=1, tags=None):
+        pass
+
+    def gauge(self, name, value, tags=None):
+        pass
+
+    def timing(self, name, value, tags=None):
+        pass
+
+    @contextmanager
+    def timer(self, name, tags=None):
+        """
+        Context manager that records the time spent in its block.
+        """
+        start = time.time()
+
+        try:
+            yield
+        finally:
+            self.timing(name, (time.time() - start) * 1000, tags)
+
+
+class StatsdMetrics(Metrics):
+    """
+    Sends the metrics with a statsd client, by default the datadog one used by edx-platform.
+    """
+    def __init__(self, client=None):
+        if client is None:
+            from datadog import statsd as client
+
+        self.client = client
+
+    @staticmethod
+    def _get_tags(tags):
+        return ["{}:{}".format(key, value) for key, value in (tags or {}).items()]
+
+    def increment(self, name, value=1, tags=None):
+        self.client.increment(name, value, tags=self._get_tags(tags))
+
+    def gauge(self, name, value, tags=None):
+        self.client.gauge(name, value, tags=self._get_tags(tags))
+
+    def timing(self, name, value, tags=None):
+        self.client.timing(name, value, tags=self._get_tags(tags))
+
+
+_METRICS = None
+_METRICS_LOCK = threading.Lock()
+
+
+def get_metrics():
+    """
+    Returns the process-wide metrics backend.
+    """
+    global _METRICS
+
+    if _METRICS is None:
+        with _METRICS_LOCK:
+            if _METRICS is None:
+                backend = getattr(settings, "SURVEYMONKEY_METRICS_BACKEND", None)
+                _METRICS = import_string(backend)() if backend else Metrics()
+
+    return _METRICS
+
+
+def get_endpoint(url):
+    """
+    Returns the path of an API url without its ids, e.g. /v3/surveys/{id}/details.
+    """
+    path = url.split("://", 1)[-1].split("?", 1)[0]
+    path = path[path.find("/"):] if "/" in path else "/"
+    return NUMERIC_PATH_SEGMENT.sub("/{id}", path)
+
+
+def record_cache_lookup(family, hit):
+    """
+    Counts a hit or a miss of a cache key family, e.g. survey_details.
+    """
+    get_metrics().increment(
+        "surveymonkey.cache.{}".format("hit" if hit else "miss"),
+        tags={"family": family},
+    )
+
+
+def timed(name):
+    """
+    Decorator that records the time spent in the decorated function as a render span.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_metrics().timer("surveymonkey.render.duration", tags={"span": name}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,298 @@
+"""
+Optional local store of the SurveyMonkey responses used to recap the previous survey answers.
+
+The answers are kept in a SQLite file, indexed by (survey_id, uid, question_heading), so the
+recap of an user is a single indexed query that survives cache evictions and process restarts.
+The store is updated incrementally with the responses modified since its last update, and it can
+be opened with any SQLite client for analytics.
+
+It is enabled by setting SURVEYMONKEY_RESPONSE_STORE_PATH to the path of the SQLite file, which
+must be shared by all the processes of a host, e.g.:
+
+    SURVEYMONKEY_RESPONSE_STORE_PATH = "/edx/var/surveymonkey/responses.sqlite3"
+"""
+import hashlib
+import logging
+import socket
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .api_surveymonkey import (
+    CACHE_FILL_POLL_INTERVAL,
+    CACHE_FILL_WAIT,
+    RESPONSE_INDEX_REFRESH_INTERVAL,
+    ApiSurveyMonkeyError,
+    get_cache_key,
+)
+
+LOG = logging.getLogger(__name__)
+SYNC_LOCK_TIMEOUT = 60
+# Seconds a connection waits for the writes of other processes.
+CONNECTION_TIMEOUT = 30
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS surveymonkey_answer (
+    survey_id TEXT NOT NULL,
+    uid TEXT NOT NULL,
+    response_id TEXT NOT NULL,
+    page_position INTEGER NOT NULL,
+    page_id TEXT NOT NULL,
+    question_position INTEGER NOT NULL,
+    question_id TEXT NOT NULL,
+    question_heading TEXT NOT NULL,
+    question_answer TEXT NOT NULL,
+    date_modified TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS surveymonkey_answer_heading
+    ON surveymonkey_answer (survey_id, uid, question_heading);
+CREATE TABLE IF NOT EXISTS surveymonkey_survey_sync (
+    survey_id TEXT PRIMARY KEY,
+    last_modified TEXT,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+def get_response_rows(survey_id, response):
+    """
+    Returns the surveymonkey_answer rows of the answered questions of a bulk response.
+    """
+    uid = response.get("custom_variables", {}).get("uid")
+
+    if not uid:
+        return []
+
+    rows = []
+
+    for page_position, page in enumerate(response.get("pages", [])):
+        for question_position, question in enumerate(page.get("questions", [])):
+            answers = question.get("answers", [])
+
+            if not answers:
+                continue
+
+            rows.append((
+                survey_id,
+                uid,
+                response.get("id", ""),
+                page_position,
+                page.get("id", ""),
+                question_position,
+                question.get("id", ""),
+                question.get("heading", ""),
+                answers[0].get("simple_text", ""),
+                response.get("date_modified", ""),
+            ))
+
+    return rows
+
+
+class ResponseStore(object):
+    """
+    SQLite store of the answers of the SurveyMonkey responses, with a connection per thread.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=CONNECTION_TIMEOUT)
+            # Readers of other processes are not blocked by the incremental updates.
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+
+        return connection
+
+    def get_user_answers(self, survey_id, uid):
+        """
+        Returns the answers of the first page of the response of uid, or None if the survey
+        responses were never stored.
+
+        Returns:
+            List: List of objects:
+                [{
+                    "page_id": Page id of the survey.
+                    "question_id": Question id of the survey.
+                    "question_heading": Survey question header.
+                    "question_answer": User answer of the question.
+                }]
+        """
+        if self.get_sync_state(survey_id) is None:
+            return None
+
+        rows = self.connection.execute(
+            """
+            SELECT page_id, question_id, question_heading, question_answer FROM surveymonkey_answer
+            WHERE survey_id = ? AND uid = ? AND page_position = 0
+            ORDER BY question_position
+            """,
+            (survey_id, uid),
+        ).fetchall()
+
+        return [
+            {
+                "page_id": page_id,
+                "question_id": question_id,
+                "question_heading": question_heading,
+                "question_answer": question_answer,
+            }
+            for page_id, question_id, question_heading, question_answer in rows
+        ]
+
+    def add_responses(self, survey_id, responses):
+        """
+        Stores the given bulk responses, replacing the previous response of their users.
+        """
+        responses = [response for response in responses if response.get("custom_variables", {}).get("uid")]
+
+        if not responses:
+            return None
+
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM surveymonkey_answer WHERE survey_id = ? AND uid = ?",
+                [(survey_id, response["custom_variables"]["uid"]) for response in responses],
+            )
+            self.connection.executemany(
+                "INSERT INTO surveymonkey_answer VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for response in responses for row in get_response_rows(survey_id, response)],
+            )
+
+        return None
+
+    def get_sync_state(self, survey_id):
+        """
+        Returns the (last_modified, synced_at) of the last update of the survey, or None.
+        """
+        return self.connection.execute(
+            "SELECT last_modified, synced_at FROM surveymonkey_survey_sync WHERE survey_id = ?",
+            (survey_id,),
+        ).fetchone()
+
+    def set_sync_state(self, survey_id, last_modified):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO surveymonkey_survey_sync VALUES (?, ?, ?)",
+                (survey_id, last_modified, time.time()),
+            )
+
+    def sync(self, api_survey_monkey, survey_id, min_interval=RESPONSE_INDEX_REFRESH_INTERVAL):
+        """
+        Stores the responses of the survey modified since the last update.
+
+        Only one worker updates a survey at a time, and the survey is not updated again before
+        min_interval seconds. The workers that need a survey that was never stored wait for the
+        first update of another worker of the host instead of requesting the same responses. The update is
+        only recorded once all the modified responses are stored, so a failed update is resumed
+        from the previous one.
+
+        Args:
+            api_survey_monkey: Instance of api_surveymonkey.ApiSurveyMonkey.
+            survey_id: SurveyMonkey survey id.
+            min_interval: Minimum number of seconds between two updates.
+        Returns:
+            Boolean: True if the survey responses are stored and up to date.
+        """
+        sync_state = self.get_sync_state(survey_id)
+
+        if sync_state and time.time() - sync_state[1] < min_interval:
+            return True
+
+        lock_key = self._get_lock_key(survey_id)
+
+        if not cache.add(lock_key, True, SYNC_LOCK_TIMEOUT):
+            if sync_state is None:
+                return self._wait_for_sync(survey_id)
+
+            return False
+
+        try:
+            last_modified = sync_state[0] if sync_state else None
+            kwargs = {
+                "simple": "true",
+                "sort_by": "date_modified",
+                "sort_order": "ASC",
+            }
+
+            if last_modified:
+                kwargs["start_modified_at"] = last_modified
+
+            responses = []
+
+            for response in api_survey_monkey.iter_survey_responses(survey_id, raise_errors=True, **kwargs):
+                responses.append(response)
+
+                if response.get("date_modified"):
+                    # SurveyMonkey expects the YYYY-MM-DDTHH:MM:SS format in start_modified_at.
+                    last_modified = max(last_modified or "", response["date_modified"][:19])
+
+                if len(responses) >= api_survey_monkey.per_page:
+                    self.add_responses(survey_id, responses)
+                    responses = []
+
+            self.add_responses(survey_id, responses)
+            self.set_sync_state(survey_id, last_modified)
+        except ApiSurveyMonkeyError:
+            LOG.warning("The responses of the survey %s could not be stored, they are updated again later", survey_id)
+            return False
+        finally:
+            cache.delete(lock_key)
+
+        return True
+
+    def _get_lock_key(self, survey_id):
+        """
+        Returns the cache key of the sync lock of the survey in this store.
+
+        The cache is shared by all the hosts but the SQLite file is not, so the lock is
+        scoped to the host and the path of the file.
+        """
+        store_id = hashlib.sha1("{}:{}".format(socket.gethostname(), self.path).encode("utf-8")).hexdigest()
+        return get_cache_key("response_store_lock", store_id, survey_id)
+
+    def _wait_for_sync(self, survey_id):
+        """
+        Waits up to CACHE_FILL_WAIT seconds for the first update of the survey by another worker.
+
+        Returns:
+            Boolean: True if the survey responses were stored by then.
+        """
+        deadline = time.time() + CACHE_FILL_WAIT
+
+        while time.time() < deadline:
+            time.sleep(CACHE_FILL_POLL_INTERVAL)
+
+            if self.get_sync_state(survey_id) is not None:
+                return True
+
+        return False
+
+
+_RESPONSE_STORE = None
+_RESPONSE_STORE_LOCK = threading.Lock()
+
+
+def get_response_store():
+    """
+    Returns the process-wide ResponseStore, or None if SURVEYMONKEY_RESPONSE_STORE_PATH is not set.
+    """
+    global _RESPONSE_STORE
+
+    path = getattr(settings, "SURVEYMONKEY_RESPONSE_STORE_PATH", None)
+
+    if not path:
+        return None
+
+    with _RESPONSE_STORE_LOCK:
+        if _RESPONSE_STORE is None or _RESPONSE_STORE.path != path:
+            _RESPONSE_STORE = ResponseStore(path)
+
+    return _RESPONSE_STORE
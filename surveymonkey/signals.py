@@ -0,0 +1,21 @@
+"""
+Signal receivers of the surveymonkey app, registered when it is in the installed apps.
+"""
+from django.dispatch import receiver
+
+from .course_cache import invalidate_course
+
+try:
+    from xmodule.modulestore.django import SignalHandler
+except ImportError:
+    # Outside of edx-platform there are no course publish signals.
+    SignalHandler = None
+
+
+if SignalHandler is not None:
+    @receiver(SignalHandler.course_published)
+    def invalidate_course_on_publish(sender, course_key, **kwargs):
+        """
+        Removes the cached course fields when the course is published in Studio.
+        """
+        invalidate_course(course_key)
@@ -2,27 +2,58 @@
 This Xblock allows to embed a survey link in a unit course.
 If the mode track-able is selected, the user anonymous id will be sent as a query parameter
 """
+import json
 import logging
-import pkg_resources
 
-from openedx.core.lib.courses import get_course_by_id
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from oauthlib.oauth2 import InvalidClientError, InvalidClientIdError
-from submissions import api as submissions_api
 from web_fragments.fragment import Fragment
 from webob.response import Response
 from xblock.core import XBlock
 from xblock.fields import Boolean, Float, Integer, Scope, String
 from xblock.validation import ValidationMessage
 from six import text_type
-from xblockutils.resources import ResourceLoader
-from xblockutils.studio_editable import StudioEditableXBlockMixin
-
-from .api_surveymonkey import ApiSurveyMonkey
+from six.moves.urllib.parse import urlencode
+
+try:
+    from xblock.utils.studio_editable import StudioEditableXBlockMixin
+except ImportError:
+    # xblock-utils imports pkg_resources, it is only used with the XBlock releases without xblock.utils.
+    from xblockutils.studio_editable import StudioEditableXBlockMixin
+
+from .api_surveymonkey import COLLECTORS_INCLUDE, ApiSurveyMonkey
+from .assets import load_resource, render_template
+from .completion import (
+    ITEM_TYPE,
+    bulk_load_completion,
+    get_cached_completion,
+    invalidate_completion,
+    preload_completion,
+    record_completion_submission,
+)
+from .course_cache import get_cached_course
+from .fragment_cache import (
+    FRAGMENT_CACHE_TIMEOUT,
+    PERSONALIZED_FRAGMENT_CACHE_TIMEOUT,
+    get_cached_fragment,
+    get_fragment_cache_key,
+    get_settings_hash,
+    set_cached_fragment,
+)
+from .heading_template import render_headings
+from .jobs import HEADINGS_JOB_QUEUE, WEBHOOK_JOB_QUEUE, get_job_queue
+from .metrics import record_cache_lookup, timed
+from .response_store import get_response_store
+from .webhooks import SUPPORTED_EVENTS, get_webhook_job_key, process_webhook_event, verify_webhook_signature
 
 LOG = logging.getLogger(__name__)
-LOADER = ResourceLoader(__name__)
+PATCH_HEADINGS_MODE = "patch"
+CUSTOM_VARIABLES_HEADINGS_MODE = "custom_variables"
+RECAP_HEADINGS_MODE = "recap"
+STUDENT_VIEW_TEMPLATE = "static/html/surveymonkey.html"
+STUDENT_VIEW_CSS = "static/css/surveymonkey.css"
+STUDENT_VIEW_JS = "static/js/src/surveymonkey.js"
 
 
 class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
@@ -133,6 +164,24 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
         default=False
     )
 
+    question_headings_mode = String(
+        display_name=_("Question headings mode."),
+        help=_("""
+            How the question headings with the user's previous responses are shown.
+            Overwrite the survey questions modifies the survey in SurveyMonkey for every user, so users answering
+            at the same time may see the headings of another user. Survey link custom variables sends them as the
+            heading_1, heading_2... custom variables of the survey link, which must be defined in the survey.
+            Recap above the survey link shows them in the course without modifying the survey.
+        """),
+        scope=Scope.settings,
+        values=[
+            {"display_name": _("Overwrite the survey questions"), "value": PATCH_HEADINGS_MODE},
+            {"display_name": _("Survey link custom variables"), "value": CUSTOM_VARIABLES_HEADINGS_MODE},
+            {"display_name": _("Recap above the survey link"), "value": RECAP_HEADINGS_MODE},
+        ],
+        default=PATCH_HEADINGS_MODE,
+    )
+
     previous_survey_name = String(
         display_name=_("Previous survey name."),
         help=_("The previous survey name to recap the responses."),
@@ -186,6 +235,7 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
         "inline_survey_view",
         "is_for_external_course",
         "overwrite_survey_questions",
+        "question_headings_mode",
         "previous_survey_name",
         "overwritten_question_headings",
         "surveymonkey_api_cache_duration",
@@ -214,34 +264,76 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
 
     def resource_string(self, path):
         """Handy helper for getting resources from our kit."""
-        data = pkg_resources.resource_string(__name__, path)
-        return data.decode("utf8")
+        return load_resource(path)
 
     # TO-DO: change this view to display your data your own way.
+    @timed("student_view")
     def student_view(self, context=None):
         """
         The primary view of the SurveyMonkeyXBlock, shown to students
         when viewing courses.
         """
-        frag = Fragment(LOADER.render_template("static/html/surveymonkey.html", self.context))
-        frag.add_css(self.resource_string("static/css/surveymonkey.css"))
-        frag.add_javascript(self.resource_string("static/js/src/surveymonkey.js"))
+        fragment_cache_key, fragment_cache_timeout = self._get_fragment_cache_key()
+
+        if fragment_cache_key:
+            frag = get_cached_fragment(fragment_cache_key)
+            record_cache_lookup("fragment", frag is not None)
+
+            if frag is not None:
+                return frag
+
+        frag = Fragment(render_template(STUDENT_VIEW_TEMPLATE, self.context))
+        frag.add_css(self.resource_string(STUDENT_VIEW_CSS))
+        frag.add_javascript(self.resource_string(STUDENT_VIEW_JS))
         frag.initialize_js(
             'SurveyMonkeyXBlock',
             json_args={
                 "is_for_external_course": self.is_for_external_course,
             },
         )
+
+        if fragment_cache_key:
+            set_cached_fragment(fragment_cache_key, frag, fragment_cache_timeout)
+
         return frag
 
+    def _get_fragment_cache_key(self):
+        """
+        Returns the (cache key, timeout) of the student view fragment of the user, or (None, None)
+        if the view must be rendered every time.
+
+        The view is not cached in Studio, nor when rendering it overwrites the survey questions
+        in SurveyMonkey. It depends on the user when the survey link is trackable or has the
+        headings of the user's previous survey responses.
+        """
+        if hasattr(self.xmodule_runtime, 'is_author_mode'):
+            return None, None
+
+        completed = self.verify_completion()
+        personalized = self.overwrite_survey_questions and not completed
+
+        if personalized and self.question_headings_mode not in (
+                CUSTOM_VARIABLES_HEADINGS_MODE, RECAP_HEADINGS_MODE):
+            return None, None
+
+        settings_hash = get_settings_hash(
+            {name: field.read_json(self) for name, field in self.fields.items() if field.scope == Scope.settings},
+            (STUDENT_VIEW_TEMPLATE, STUDENT_VIEW_CSS, STUDENT_VIEW_JS),
+        )
+        uid = self.runtime.anonymous_student_id if self.trackable or personalized else None
+        cache_key = get_fragment_cache_key(self.location, settings_hash, completed, None if completed else uid)
+
+        return cache_key, PERSONALIZED_FRAGMENT_CACHE_TIMEOUT if personalized else FRAGMENT_CACHE_TIMEOUT
+
     def studio_view(self, context=None):
         """  Returns edit studio view fragment """
         context = {
             "completion_page": self.get_handler_url("completion"),
             "confirmation_page": self.get_handler_url("confirmation"),
+            "webhook_page": self.get_noauth_handler_url("webhook"),
         }
         frag = super(SurveyMonkeyXBlock, self).studio_view(context)
-        frag.add_content(LOADER.render_template("static/html/surveymonkeystudio.html", context))
+        frag.add_content(render_template("static/html/surveymonkeystudio.html", context))
         frag.add_javascript(self.resource_string("static/js/src/studio_view.js"))
         frag.initialize_js('StudioViewEdit')
         return frag
@@ -259,22 +351,53 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
             handler_name=handler_name,
         )
 
+    def get_noauth_handler_url(self, handler_name):
+        """
+        Returns the LMS url of a handler that can be called without a session, e.g. by SurveyMonkey.
+        """
+        base = settings.LMS_BASE
+
+        if base.endswith("/"):
+            base = base[:-1]
+
+        return "{base}/courses/{course_key}/xblock/{usage_key}/handler_noauth/{handler_name}".format(
+            base=base,
+            course_key=self.course_id,
+            usage_key=self.location,
+            handler_name=handler_name,
+        )
+
     @property
+    @timed("context")
     def context(self):
 
         link = self.survey_link
+        link_params = []
+        recap_headings = []
 
         if self.trackable:
-            link = "{}?uid={}".format(link, self.runtime.anonymous_student_id)
+            link_params.append(("uid", self.runtime.anonymous_student_id))
 
         if self.overwrite_survey_questions and not (hasattr(self.xmodule_runtime, 'is_author_mode') or self.completed_survey):
-            self.overwrite_survey_question_headings()
+            if self.question_headings_mode == CUSTOM_VARIABLES_HEADINGS_MODE:
+                link_params.extend(
+                    ("heading_{}".format(index), heading)
+                    for index, heading in enumerate(self.get_personalized_question_headings(), 1)
+                )
+            elif self.question_headings_mode == RECAP_HEADINGS_MODE:
+                recap_headings = self.get_personalized_question_headings()
+            else:
+                self.overwrite_survey_question_headings()
+
+        if link_params:
+            link = "{}?{}".format(link, urlencode(link_params))
 
         context = {
             "title": self.display_name,
             "introductory_text": self.introductory_text,
             "text_link": self.text_link,
             "survey_link": link,
+            "recap_headings": recap_headings,
             "completed_survey": self.verify_completion() if not hasattr(self.xmodule_runtime, 'is_author_mode') else True,
             "completion_page": self.get_handler_url("completion"),
             "inline_survey_view": self.inline_survey_view,
@@ -305,8 +428,7 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
         """
         collectors = api_surveymonkey.get_collectors(
             suvey_id,
-            self.location.block_id,
-            **{"include": "url,type,survey_id"}
+            **{"include": COLLECTORS_INCLUDE}
         )
         data_collectors = collectors.get("data", [])
 
@@ -337,10 +459,7 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
             None: If the survey does not exists or there are more than one survey with the
                 same name.
         """
-        response = api_surveymonkey.get_surveys()
-        data_response = response.get("data", [])
-
-        survey_data = [survey for survey in data_response if survey["title"] == survey_name]
+        survey_data = api_surveymonkey.get_surveys_by_title(survey_name)
         survey_data_length = len(survey_data)
 
         if not survey_data_length:
@@ -356,24 +475,39 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
 
         return survey_data
 
-    def _check_completion_from_submissions(self):
+    def _load_completion(self):
         """
+        Loads the completion of this block and of the other surveymonkey blocks of the unit
+        with a single submissions query, so the sibling blocks read it from the cache.
         """
-        completion = False
-        last_submission = None
+        item_ids = [self.location.block_id]
+
         try:
-            submissions = submissions_api.get_submissions(self.student_item)
-            if submissions:
-                completion = True
-                last_submission = submissions[0]
+            parent = self.get_parent()
+        except Exception:
+            parent = None
+
+        if parent is not None:
+            item_ids.extend(
+                child.block_id for child in parent.children
+                if child.block_type == ITEM_TYPE and child.block_id != self.location.block_id
+            )
+
+        try:
+            completions = preload_completion(
+                self.runtime.anonymous_student_id,
+                text_type(self.course_id),
+                item_ids,
+            )
         except Exception:
             LOG.info(
                 "Error getting submissions for the survey %s related to course %s",
                 self.survey_name,
                 text_type(self.course_id),
             )
+            return False
 
-        return completion, last_submission
+        return completions.get(self.location.block_id, False)
 
     @property
     def student_item(self):
@@ -381,7 +515,7 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
             student_id=self.runtime.anonymous_student_id,
             course_id=text_type(self.course_id),
             item_id=self.location.block_id,
-            item_type="surveymonkey",
+            item_type=ITEM_TYPE,
         )
         return item
 
@@ -401,12 +535,17 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
         except InvalidClientIdError:
             return None
 
+    @timed("verify_completion")
     def verify_completion(self):
         if not self.completed_survey:
-            submission_status, last_submission = self._check_completion_from_submissions()
-            if submission_status and last_submission:
+            completion = get_cached_completion(self.student_item)
+            record_cache_lookup("completion", completion is not None)
+
+            if completion is None:
+                completion = self._load_completion()
+
+            if completion:
                 self.completed_survey = True
-                # submissions_api.set_score(last_submission.get("uuid"), self.weight, self.weight)
                 return True
 
         return self.completed_survey
@@ -414,50 +553,111 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
     def max_score(self):
         return self.weight
 
+    @classmethod
+    def bulk_completion(cls, course_id, block_ids, anonymous_ids):
+        """
+        Returns the completion of many learners for many surveymonkey blocks of a course, e.g. for
+        the progress page or a grade report, with a few submissions queries instead of one per
+        learner and block.
+
+        Args:
+            course_id: Course key or course id string.
+            block_ids: Usage keys or block ids of the surveymonkey blocks.
+            anonymous_ids: Anonymous user ids of the learners.
+        Returns:
+            Dict: Set of the anonymous ids that completed the survey, for every block id.
+        """
+        return bulk_load_completion(
+            text_type(course_id),
+            [getattr(block_id, "block_id", block_id) for block_id in block_ids],
+            anonymous_ids,
+        )
+
     @XBlock.handler
     def completion(self, request, suffix=''):
-
         context = {
-            "course": get_course_by_id(self.course_id),
+            "course": get_cached_course(self.course_id),
             "completed_survey": self.verify_completion(),
             "css": self.resource_string("static/css/surveymonkey.css"),
             "online_help_token": "online_help_token",
         }
-        return Response(LOADER.render_template("static/html/surveymonkey_completion_page.html", context))
+        return Response(render_template("static/html/surveymonkey_completion_page.html", context))
 
     @XBlock.handler
     def confirmation(self, request, suffix=''):
-
         uid = request.params.get('uid')
         user = self.runtime.get_real_user(uid)
 
         try:
             if user and self.is_for_external_course:
-                submissions_api.create_submission(
-                    self.student_item,
-                    {"survey_completed":True}
-                )
+                record_completion_submission(self.student_item)
         except Exception:
-            LOG.info(
+            invalidate_completion(self.student_item)
+            LOG.exception(
                 "Error creating a submission for the survey %s related to course %s",
                 self.survey_name,
                 text_type(self.course_id),
             )
 
-        course = get_course_by_id(self.course_id)
         context = {
             "completed_survey": self.verify_completion(),
             "css": self.resource_string("static/css/surveymonkey.css"),
-            "course_link": course.other_course_settings.get("external_course_target"),
+            "course_link": get_cached_course(self.course_id).external_course_target,
         }
-        return Response(LOADER.render_template("static/html/surveymonkey_confirmation_page.html", context))
+        return Response(render_template("static/html/surveymonkey_confirmation_page.html", context))
+
+    @XBlock.handler
+    def webhook(self, request, suffix=''):
+        """
+        Receives the SurveyMonkey webhook events of the survey and processes them in the background.
+
+        SurveyMonkey sends a HEAD request to verify the url when the webhook is created.
+        """
+        if request.method == "HEAD":
+            return Response(status=200)
+
+        if not verify_webhook_signature(
+                request.body,
+                request.headers.get("Sm-Signature"),
+                self.client_id,
+                self.client_secret):
+            return Response(status=401)
+
+        try:
+            event = json.loads(request.body.decode("utf-8"))
+        except ValueError:
+            return Response(status=400)
+
+        if event.get("event_type") not in SUPPORTED_EVENTS or not self._api_survey_monkey:
+            return Response(status=200)
+
+        enqueued = get_job_queue(WEBHOOK_JOB_QUEUE).enqueue(
+            get_webhook_job_key(event),
+            process_webhook_event,
+            self._api_survey_monkey,
+            event,
+            {
+                "course_id": text_type(self.course_id),
+                "item_id": self.location.block_id,
+            },
+            self.survey_id,
+            self.previous_survey_id if self.overwrite_survey_questions else None,
+        )
+
+        if not enqueued:
+            # SurveyMonkey retries the events that are not successfully delivered.
+            return Response(status=503)
 
+        return Response(status=200)
+
+    @timed("overwrite_survey_question_headings")
     def overwrite_survey_question_headings(self):
         """
         Overwrites the survey question headings.
 
-        Takes the values returned from self.get_overwritten_question_from_field
-        to overwrite the question heading with the user's response.
+        Takes the headings returned from self.get_personalized_question_headings
+        to overwrite the question heading with the user's response. The PATCH requests
+        are sent by the headings job queue, so this returns without waiting for them.
 
         Raises:
             Exception: If previous_survey_id or self.survey_id were not found.
@@ -465,79 +665,45 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
         if not (self.previous_survey_id or self.survey_id):
             raise Exception("Not enough arguments were found.")
 
-        previous_responses = self.get_user_previous_survey_responses()
-        overwritten_questions = self.get_overwritten_question_from_field()
-        new_question_headings = []
-
-        for overwritten_question in overwritten_questions:
-            overwritten_question_heading = overwritten_question
-
-            for previous_response in previous_responses:
-                question_heading = "{{{question_heading}}}".format(
-                    question_heading=previous_response.get("question_heading", ""),
-                )
-
-                if question_heading in overwritten_question_heading:
-                    overwritten_question_heading = overwritten_question_heading.replace(question_heading, previous_response.get("question_answer", ""))
-
-            new_question_headings.append(overwritten_question_heading)
+        new_question_headings = self.get_personalized_question_headings()
 
         if not new_question_headings:
             return None
 
-        survey_details = self._api_survey_monkey.get_survey_details(self.survey_id, self.location.block_id)
-        survey_pages = survey_details.get("pages", [])
-
-        if not survey_pages:
-            return None
-
-        # Let's take the first page of the survey because API calls do not support pagination.
-        survey_questions = survey_pages[0].get("questions", [])
-
-        for index, new_question_heading in enumerate(new_question_headings):
-            patch_data = {
-                "headings": [{
-                    "heading": new_question_heading,
-                }],
-            }
-
-            try:
-                self._api_survey_monkey.patch_question_data(
-                    self.survey_id,
-                    survey_pages[0].get("id", ""),
-                    survey_questions[index].get("id", ""),
-                    **patch_data
-                )
-            except IndexError:
-                # This means that there are no more questions in the survey, therefore,
-                # it's not necessary to make more API calls.
-                break
+        get_job_queue(HEADINGS_JOB_QUEUE).enqueue(
+            ("overwrite_question_headings", self.client_id, self.survey_id),
+            self._api_survey_monkey.overwrite_question_headings,
+            self.survey_id,
+            new_question_headings,
+        )
 
         return None
 
-    def get_overwritten_question_from_field(self):
+    def get_personalized_question_headings(self):
         """
-        Parses and returns the questions contained in the overwritten_question_headings field.
-        Splits each question into a new line and then return them as a items in a list.
+        Returns the question headings of the overwritten_question_headings field with the
+        {question heading} placeholders replaced by the user's previous responses, see
+        heading_template for the placeholder syntax.
+
+        It only reads the previous survey responses, so the headings can be sent in the
+        survey link or rendered in the course without modifying the survey.
 
         Returns:
-            List: Containing the question headings to overwrite.
+            List: The personalized question headings.
         """
         if (self.overwritten_question_headings == self.default_overwritten_question_headings_text or
                 not self.overwrite_survey_questions):
             return []
 
-        overwritten_headings = self.overwritten_question_headings.splitlines()
-        headings_data = []
+        answers = {}
 
-        for overwritten_heading in overwritten_headings:
-            # This is to avoid the blank spaces values.
-            if not overwritten_heading:
-                continue
-
-            headings_data.append(overwritten_heading)
+        for previous_response in self.get_user_previous_survey_responses():
+            answers.setdefault(
+                previous_response.get("question_heading", ""),
+                previous_response.get("question_answer", ""),
+            )
 
-        return headings_data
+        return render_headings(self.overwritten_question_headings, answers)
 
     def get_user_previous_survey_responses(self):
         """
@@ -552,21 +718,25 @@ class SurveyMonkeyXBlock(XBlock, StudioEditableXBlockMixin):
                     "question_answer": User answer of the previous question.
                 }]
         """
-        kwargs = {"simple": "true"}
-        previous_survey_responses = self._api_survey_monkey.get_survey_responses(self.previous_survey_id, **kwargs)
+        response_store = get_response_store()
 
-        if not previous_survey_responses:
-            return []
+        if response_store is not None:
+            previous_data = response_store.get_user_answers(self.previous_survey_id, self.runtime.anonymous_student_id)
 
-        user_id = self.runtime.anonymous_student_id
-        user_response = {}
+            if not previous_data and response_store.sync(self._api_survey_monkey, self.previous_survey_id):
+                previous_data = response_store.get_user_answers(
+                    self.previous_survey_id,
+                    self.runtime.anonymous_student_id,
+                )
 
-        for response in previous_survey_responses.get("data", []):
-            custom_variables = response.get("custom_variables", {})
+            # The response index is used while the survey was never stored in this host.
+            if previous_data is not None:
+                return previous_data
 
-            if custom_variables.get("uid") == user_id:
-                user_response = response
-                break
+        user_response = self._api_survey_monkey.get_user_survey_response(
+            self.previous_survey_id,
+            self.runtime.anonymous_student_id,
+        )
 
         if not user_response:
             return []
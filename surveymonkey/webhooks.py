@@ -0,0 +1,156 @@
+"""
+Processing of the SurveyMonkey webhook events received by the surveymonkey blocks.
+
+SurveyMonkey signs the body of every event with the client id and secret of the app, see
+https://developer.surveymonkey.com/api/v3/#webhooks
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import threading
+
+from .api_surveymonkey import COLLECTORS_INCLUDE
+from .completion import ITEM_TYPE, create_completion_submission
+from .jobs import WEBHOOK_JOB_QUEUE, get_job_queue
+from .response_store import get_response_store
+
+LOG = logging.getLogger(__name__)
+RESPONSE_COMPLETED_EVENT = "response_completed"
+SURVEY_UPDATED_EVENT = "survey_updated"
+COLLECTOR_UPDATED_EVENTS = ("collector_created", "collector_updated")
+SUPPORTED_EVENTS = (RESPONSE_COMPLETED_EVENT, SURVEY_UPDATED_EVENT) + COLLECTOR_UPDATED_EVENTS
+# Seconds to wait before every new attempt to process an event whose response could not be returned.
+WEBHOOK_RETRY_DELAYS = (30, 120, 600)
+
+
+def verify_webhook_signature(body, signature, client_id, client_secret):
+    """
+    Returns True if signature is the Sm-Signature of the body for the given SurveyMonkey app.
+
+    Args:
+        body: Raw body bytes of the webhook request.
+        signature: Value of the Sm-Signature header.
+        client_id: Client id of the SurveyMonkey app.
+        client_secret: Client secret of the SurveyMonkey app.
+    """
+    if not (signature and client_id and client_secret):
+        return False
+
+    key = "{}&{}".format(client_id, client_secret).encode("utf-8")
+    expected_signature = base64.b64encode(hmac.new(key, body, hashlib.sha1).digest())
+
+    return hmac.compare_digest(expected_signature, signature.encode("utf-8"))
+
+
+def get_webhook_job_key(event):
+    """
+    Returns the key of the webhook job queue jobs of the event, so the duplicated deliveries are coalesced.
+    """
+    return ("webhook", event.get("event_id") or event.get("object_id"))
+
+
+def process_webhook_event(api_survey_monkey, event, student_item_base, survey_id, previous_survey_id=None, attempt=0):
+    """
+    Processes a webhook event of the survey of a surveymonkey block.
+
+    SurveyMonkey does not send the event again once the handler answered it, so the events whose
+    response could not be returned are processed again after the WEBHOOK_RETRY_DELAYS.
+
+    Args:
+        api_survey_monkey: Instance of api_surveymonkey.ApiSurveyMonkey.
+        event: Webhook event data.
+        student_item_base: Dict with the course_id and item_id of the block.
+        survey_id: Survey id of the block.
+        previous_survey_id: Previous survey id of the block, whose response index is updated.
+        attempt: Number of previous attempts to process the event.
+    """
+    event_type = event.get("event_type")
+    event_survey_id = event.get("resources", {}).get("survey_id")
+
+    if event_survey_id not in (survey_id, previous_survey_id):
+        LOG.info("Surveymonkey webhook event %s ignored for the survey %s", event_type, event_survey_id)
+        return None
+
+    if event_type == RESPONSE_COMPLETED_EVENT:
+        response = api_survey_monkey.get_survey_response(event_survey_id, event.get("object_id"), simple="true")
+
+        if not response:
+            retry_webhook_event(
+                (api_survey_monkey, event, student_item_base, survey_id, previous_survey_id),
+                attempt,
+            )
+            return None
+
+        if event_survey_id == previous_survey_id:
+            api_survey_monkey.add_to_response_index(previous_survey_id, response)
+            response_store = get_response_store()
+
+            if response_store is not None:
+                response_store.add_responses(previous_survey_id, [response])
+
+        if event_survey_id == survey_id:
+            record_completion(response, student_item_base)
+    elif event_type == SURVEY_UPDATED_EVENT:
+        api_survey_monkey.invalidate_survey(event_survey_id)
+    elif event_type in COLLECTOR_UPDATED_EVENTS:
+        api_survey_monkey.invalidate_collectors(event_survey_id, include=COLLECTORS_INCLUDE)
+
+    return None
+
+
+def retry_webhook_event(args, attempt):
+    """
+    Enqueues the event processed with the given process_webhook_event args again after the
+    delay of the attempt, or logs it as lost after the last attempt.
+    """
+    event = args[1]
+
+    if attempt >= len(WEBHOOK_RETRY_DELAYS):
+        LOG.error(
+            "Surveymonkey webhook event %s of the response %s is lost after %s attempts, "
+            "run reconcile_surveymonkey_completions to record its completion",
+            event.get("event_id"),
+            event.get("object_id"),
+            attempt + 1,
+        )
+        return None
+
+    def enqueue():
+        enqueued = get_job_queue(WEBHOOK_JOB_QUEUE).enqueue(
+            get_webhook_job_key(event),
+            process_webhook_event,
+            *args,
+            attempt=attempt + 1
+        )
+
+        if not enqueued:
+            LOG.error(
+                "Surveymonkey webhook event %s of the response %s is lost, the job queue is full",
+                event.get("event_id"),
+                event.get("object_id"),
+            )
+
+    LOG.warning(
+        "Surveymonkey webhook event %s of the response %s failed, retrying in %s seconds",
+        event.get("event_id"),
+        event.get("object_id"),
+        WEBHOOK_RETRY_DELAYS[attempt],
+    )
+    timer = threading.Timer(WEBHOOK_RETRY_DELAYS[attempt], enqueue)
+    timer.daemon = True
+    timer.start()
+    return None
+
+
+def record_completion(response, student_item_base):
+    """
+    Creates the submission of the learner of a completed response, unless it already exists.
+    """
+    uid = response.get("custom_variables", {}).get("uid")
+
+    if not uid:
+        return None
+
+    create_completion_submission(dict(student_item_base, student_id=uid, item_type=ITEM_TYPE))
+    return None
@@ -0,0 +1,73 @@
+"""
+Base test case of the tests that call the fake SurveyMonkey API of the benchmarks.
+"""
+import time
+import unittest
+
+from fake_surveymonkey import FakeSurveyMonkeyData, FakeSurveyMonkeyServer
+from run_benchmarks import point_to_fake_api, reset_state
+
+from surveymonkey.api_surveymonkey import ApiSurveyMonkey
+
+CLIENT_ID = "test-client"
+CLIENT_SECRET = "test-secret"
+CACHE_DURATION = 600
+PER_PAGE = 10
+
+
+def wait_until(condition, timeout=5):
+    """
+    Polls condition until it returns a true value or timeout seconds pass, and returns its last value.
+    """
+    deadline = time.time() + timeout
+    value = condition()
+
+    while not value and time.time() < deadline:
+        time.sleep(0.05)
+        value = condition()
+
+    return value
+
+
+class FakeApiTestCase(unittest.TestCase):
+    """
+    Runs the tests against a fake SurveyMonkey API, with an empty cache and new clients per test.
+    """
+    surveys = 20
+    collectors = 5
+    responses = 50
+
+    @classmethod
+    def setUpClass(cls):
+        super(FakeApiTestCase, cls).setUpClass()
+        cls.server = FakeSurveyMonkeyServer(FakeSurveyMonkeyData(cls.surveys, cls.collectors, cls.responses))
+        cls.server.__enter__()
+        point_to_fake_api(cls.server.base_url)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+        super(FakeApiTestCase, cls).tearDownClass()
+
+    def setUp(self):
+        super(FakeApiTestCase, self).setUp()
+        reset_state()
+        self.data = FakeSurveyMonkeyData(self.surveys, self.collectors, self.responses)
+        self.server.data = self.data
+        self.server.requests.clear()
+
+    def build_api(self, cache_duration=CACHE_DURATION):
+        return ApiSurveyMonkey(CLIENT_ID, CLIENT_SECRET, cache_duration, per_page=PER_PAGE)
+
+    def add_response(self, uid, date_modified="2021-02-01T00:00:00+00:00"):
+        """
+        Adds a response of uid to the fake API, modified after the generated ones.
+        """
+        response = {
+            "id": str(600000 + len(self.data.responses)),
+            "date_modified": date_modified,
+            "custom_variables": {"uid": uid},
+            "pages": [{"id": "500000", "questions": []}],
+        }
+        self.data.responses.append(response)
+        return response
@@ -0,0 +1,11 @@
+"""
+Configures Django with the in-memory cache and submissions stand-in of the benchmarks.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from run_benchmarks import setup_django  # noqa: E402
+
+setup_django()
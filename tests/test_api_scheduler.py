@@ -0,0 +1,149 @@
+"""
+Tests of the rate limiter, the circuit breaker and the retries of the SurveyMonkey requests.
+"""
+import unittest
+from unittest import mock
+
+import requests
+
+from surveymonkey.api_scheduler import (
+    DEFAULT_BACKOFF_MAX,
+    CircuitBreaker,
+    RequestScheduler,
+    TokenBucket,
+)
+
+URL = "https://api.surveymonkey.com/v3/surveys/100000/details"
+
+
+def build_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = b"{}"
+    return response
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_tokens_are_reserved_until_the_bucket_is_empty(self):
+        bucket = TokenBucket(60)
+        bucket.tokens = 2
+
+        self.assertEqual(bucket.reserve(max_wait=0), 0)
+        self.assertEqual(bucket.reserve(max_wait=0), 0)
+        self.assertIsNone(bucket.reserve(max_wait=0))
+        self.assertAlmostEqual(bucket.reserve(max_wait=2), 1, places=1)
+
+    def test_blocked_bucket_does_not_hand_out_tokens(self):
+        bucket = TokenBucket(60)
+        bucket.block(30)
+
+        self.assertIsNone(bucket.reserve(max_wait=2))
+        self.assertAlmostEqual(bucket.get_blocked_time(), 30, places=0)
+
+    def test_bucket_follows_the_rate_limit_headers(self):
+        bucket = TokenBucket(60)
+        bucket.update(build_response(200, {
+            "X-Ratelimit-App-Global-Minute-Remaining": "0",
+            "X-Ratelimit-App-Global-Minute-Reset": "20",
+            "X-Ratelimit-App-Global-Day-Remaining": "100",
+        }))
+
+        self.assertEqual(bucket.minute_remaining, 0)
+        self.assertEqual(bucket.day_remaining, 100)
+        self.assertAlmostEqual(bucket.get_blocked_time(), 20, places=0)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_circuit_opens_after_the_failure_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+
+        self.assertTrue(breaker.allow_request())
+
+        breaker.record_failure()
+
+        self.assertFalse(breaker.allow_request())
+
+    def test_success_closes_the_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.failures, 0)
+
+    def test_one_request_is_let_through_after_the_reset_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        breaker.opened_at -= 30
+
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+
+
+@mock.patch("surveymonkey.api_scheduler.time.sleep")
+class RequestSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = RequestScheduler()
+        self.scheduler.max_retries = 2
+        self.scheduler.max_rate_limit_wait = 2
+        self.scheduler.circuit_breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+        self.session = mock.Mock()
+
+    def test_transient_errors_are_retried_with_backoff(self, sleep):
+        self.session.request.side_effect = [build_response(503), build_response(502), build_response(200)]
+
+        response = self.scheduler.request(self.session, "get", URL)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.session.request.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(self.scheduler.circuit_breaker.failures, 0)
+
+    def test_last_error_is_returned_after_the_retries(self, sleep):
+        self.session.request.return_value = build_response(500)
+
+        response = self.scheduler.request(self.session, "get", URL)
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.session.request.call_count, 3)
+
+    def test_connection_errors_are_returned_as_unavailable(self, sleep):
+        self.session.request.side_effect = requests.ConnectionError("refused")
+        self.scheduler.max_retries = 0
+
+        self.assertEqual(self.scheduler.request(self.session, "get", URL).status_code, 503)
+
+    def test_client_errors_are_not_retried(self, sleep):
+        self.session.request.return_value = build_response(404)
+
+        self.assertEqual(self.scheduler.request(self.session, "get", URL).status_code, 404)
+        self.assertEqual(self.session.request.call_count, 1)
+
+    def test_long_retry_after_fails_fast(self, sleep):
+        self.session.request.return_value = build_response(429, {"Retry-After": "60"})
+
+        response = self.scheduler.request(self.session, "get", URL)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.session.request.call_count, 1)
+        sleep.assert_not_called()
+        self.assertAlmostEqual(self.scheduler.rate_limiter.get_blocked_time(), 60, places=0)
+
+    def test_rate_limited_responses_open_the_circuit(self, sleep):
+        self.session.request.return_value = build_response(429)
+
+        self.scheduler.request(self.session, "get", URL)
+        response = self.scheduler.request(self.session, "get", URL)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.session.request.call_count, 3)
+
+    def test_backoff_is_capped(self, sleep):
+        self.assertLessEqual(RequestScheduler.get_backoff(20), DEFAULT_BACKOFF_MAX)
+        self.assertEqual(RequestScheduler.get_backoff(0, retry_after=3), 3)
+        self.assertEqual(RequestScheduler.get_backoff(0, retry_after=600), DEFAULT_BACKOFF_MAX)
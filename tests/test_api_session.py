@@ -0,0 +1,50 @@
+"""
+Tests of the process-wide SurveyMonkey clients and their access tokens.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+from surveymonkey import api_session
+from surveymonkey.api_session import SurveyMonkeyClient, get_client
+from tests.base import CLIENT_ID, CLIENT_SECRET, FakeApiTestCase
+
+
+class GetClientTest(FakeApiTestCase):
+
+    def test_client_is_shared_by_the_same_credentials(self):
+        client = get_client(CLIENT_ID, CLIENT_SECRET)
+
+        self.assertIs(get_client(CLIENT_ID, CLIENT_SECRET), client)
+        self.assertIsNot(get_client(CLIENT_ID, "other-secret"), client)
+        self.assertEqual(self.server.requests["token"], 2)
+
+    def test_client_is_not_kept_without_access_token(self):
+        self.data.failing_pages.add(("token", 1))
+
+        with self.assertRaises(Exception):
+            get_client(CLIENT_ID, CLIENT_SECRET)
+
+        self.assertEqual(api_session._CLIENTS, {})
+
+    def test_token_requested_by_another_worker_is_reused(self):
+        token_cache_key = SurveyMonkeyClient(CLIENT_ID, CLIENT_SECRET).token_cache_key
+        lock_key = "{}-lock".format(token_cache_key)
+        cache.add(lock_key, True)
+        token_data = {
+            "headers": {"Authorization": "Bearer other-worker-token"},
+            "expires_at": time.time() + 60,
+        }
+
+        def store_token():
+            cache.set(token_cache_key, token_data, 60)
+            cache.delete(lock_key)
+
+        timer = threading.Timer(0.3, store_token)
+        timer.start()
+        client = get_client(CLIENT_ID, CLIENT_SECRET)
+        timer.join()
+
+        self.assertEqual(client.get_headers(), token_data["headers"])
+        self.assertEqual(self.server.requests["token"], 0)
@@ -0,0 +1,196 @@
+"""
+Tests of the idempotent completion submissions and of their bulk loading.
+"""
+import unittest
+
+from unittest import mock
+
+from django.core.cache import cache
+from opaque_keys.edx.keys import CourseKey
+from run_benchmarks import SUBMISSIONS
+
+from surveymonkey import SurveyMonkeyXBlock
+from surveymonkey.completion import (
+    ITEM_TYPE,
+    MAX_SUBMISSION_ATTEMPTS,
+    SubmissionBuffer,
+    bulk_load_completion,
+    create_completion_submission,
+    get_cached_completion,
+    get_completion_cache_key,
+)
+
+STUDENT_ITEM = {
+    "student_id": "student-0",
+    "course_id": "course-v1:edX+Test+2021",
+    "item_id": "surveymonkey-block",
+    "item_type": ITEM_TYPE,
+}
+
+
+class CompletionSubmissionTest(unittest.TestCase):
+
+    def setUp(self):
+        super(CompletionSubmissionTest, self).setUp()
+        cache.clear()
+        del SUBMISSIONS.student_items[:]
+
+    def test_submission_is_created_and_cached(self):
+        self.assertTrue(create_completion_submission(dict(STUDENT_ITEM)))
+        self.assertEqual(SUBMISSIONS.student_items, [STUDENT_ITEM])
+        self.assertTrue(get_cached_completion(STUDENT_ITEM))
+
+    def test_repeated_confirmations_create_a_single_submission(self):
+        create_completion_submission(dict(STUDENT_ITEM))
+
+        self.assertFalse(create_completion_submission(dict(STUDENT_ITEM)))
+        self.assertEqual(len(SUBMISSIONS.student_items), 1)
+
+    def test_existing_submission_is_not_created_again_after_a_cache_miss(self):
+        create_completion_submission(dict(STUDENT_ITEM))
+        cache.clear()
+
+        self.assertFalse(create_completion_submission(dict(STUDENT_ITEM)))
+        self.assertEqual(len(SUBMISSIONS.student_items), 1)
+        self.assertTrue(get_cached_completion(STUDENT_ITEM))
+
+    def test_submission_being_created_by_another_request_is_skipped(self):
+        cache.add("{}-lock".format(get_completion_cache_key(
+            STUDENT_ITEM["student_id"],
+            STUDENT_ITEM["course_id"],
+            STUDENT_ITEM["item_id"],
+        )), True)
+
+        self.assertFalse(create_completion_submission(dict(STUDENT_ITEM)))
+        self.assertEqual(SUBMISSIONS.student_items, [])
+
+    def test_submissions_of_other_blocks_are_created(self):
+        create_completion_submission(dict(STUDENT_ITEM))
+
+        self.assertTrue(create_completion_submission(dict(STUDENT_ITEM, item_id="other-block")))
+        self.assertEqual(len(SUBMISSIONS.student_items), 2)
+
+
+class SubmissionBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        super(SubmissionBufferTest, self).setUp()
+        cache.clear()
+        del SUBMISSIONS.student_items[:]
+        self.failing_student_ids = set()
+        self.buffer = SubmissionBuffer(delay=0)
+        patchers = [
+            mock.patch("surveymonkey.completion.get_job_queue"),
+            # The transaction of a batch fails, so the student items are written one by one.
+            mock.patch.object(SubmissionBuffer, "_write", side_effect=Exception("Database error")),
+            mock.patch("surveymonkey.completion.submissions_api.create_submission", side_effect=self.create_submission),
+        ]
+
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create_submission(self, student_item, answer):
+        if student_item["student_id"] in self.failing_student_ids:
+            raise Exception("Database error")
+
+        return SUBMISSIONS.create_submission(student_item, answer)
+
+    def test_failed_batch_is_written_one_by_one(self):
+        self.buffer.add(dict(STUDENT_ITEM))
+        self.buffer.add(dict(STUDENT_ITEM, student_id="student-1"))
+        self.buffer.flush()
+
+        self.assertEqual([item["student_id"] for item in SUBMISSIONS.student_items], ["student-0", "student-1"])
+        self.assertEqual(self.buffer._student_items, {})
+
+    def test_failed_submissions_are_buffered_again(self):
+        self.failing_student_ids.add("student-1")
+        self.buffer.add(dict(STUDENT_ITEM))
+        self.buffer.add(dict(STUDENT_ITEM, student_id="student-1"))
+        self.buffer.flush()
+
+        self.assertEqual([item["student_id"] for item in SUBMISSIONS.student_items], ["student-0"])
+        self.assertEqual([item["student_id"] for item in self.buffer._student_items.values()], ["student-1"])
+        self.assertTrue(get_cached_completion(dict(STUDENT_ITEM, student_id="student-1")))
+
+        self.failing_student_ids.clear()
+        self.buffer.flush()
+
+        self.assertEqual(len(SUBMISSIONS.student_items), 2)
+        self.assertEqual(self.buffer._attempts, {})
+
+    def test_submissions_are_dropped_after_the_last_attempt(self):
+        self.failing_student_ids.add("student-0")
+        self.buffer.add(dict(STUDENT_ITEM))
+
+        for _ in range(MAX_SUBMISSION_ATTEMPTS):
+            self.buffer.flush()
+
+        self.assertEqual(self.buffer._student_items, {})
+        self.assertEqual(SUBMISSIONS.student_items, [])
+        self.assertIsNone(get_cached_completion(STUDENT_ITEM))
+
+
+class BulkLoadCompletionTest(unittest.TestCase):
+
+    def setUp(self):
+        super(BulkLoadCompletionTest, self).setUp()
+        cache.clear()
+        del SUBMISSIONS.student_items[:]
+        self.student_ids = ["student-{}".format(index) for index in range(5)]
+        create_completion_submission(dict(STUDENT_ITEM))
+        create_completion_submission(dict(STUDENT_ITEM, student_id="student-3"))
+        create_completion_submission(dict(STUDENT_ITEM, student_id="student-3", item_id="other-block"))
+        create_completion_submission(dict(STUDENT_ITEM, student_id="student-4", course_id="course-v1:edX+Other+2021"))
+        cache.clear()
+        SUBMISSIONS.queries = 0
+
+    def test_completions_are_loaded_with_a_query_per_chunk(self):
+        completions = bulk_load_completion(
+            STUDENT_ITEM["course_id"],
+            [STUDENT_ITEM["item_id"], "other-block"],
+            self.student_ids,
+            chunk_size=4,
+        )
+
+        self.assertEqual(completions, {
+            STUDENT_ITEM["item_id"]: {"student-0", "student-3"},
+            "other-block": {"student-3"},
+        })
+        # 2 students of the 2 blocks per chunk.
+        self.assertEqual(SUBMISSIONS.queries, 3)
+
+    def test_loaded_completions_are_cached(self):
+        completions = bulk_load_completion(STUDENT_ITEM["course_id"], [STUDENT_ITEM["item_id"]], self.student_ids)
+        SUBMISSIONS.queries = 0
+
+        self.assertEqual(
+            bulk_load_completion(STUDENT_ITEM["course_id"], [STUDENT_ITEM["item_id"]], self.student_ids),
+            completions,
+        )
+        self.assertEqual(SUBMISSIONS.queries, 0)
+        self.assertTrue(get_cached_completion(STUDENT_ITEM))
+        self.assertFalse(get_cached_completion(dict(STUDENT_ITEM, student_id="student-1")))
+
+    def test_only_the_missing_completions_are_loaded(self):
+        bulk_load_completion(STUDENT_ITEM["course_id"], [STUDENT_ITEM["item_id"]], self.student_ids[:2])
+        SUBMISSIONS.queries = 0
+
+        completions = bulk_load_completion(STUDENT_ITEM["course_id"], [STUDENT_ITEM["item_id"]], self.student_ids)
+
+        self.assertEqual(completions, {STUDENT_ITEM["item_id"]: {"student-0", "student-3"}})
+        self.assertEqual(SUBMISSIONS.queries, 1)
+
+    def test_no_blocks(self):
+        self.assertEqual(bulk_load_completion(STUDENT_ITEM["course_id"], [], self.student_ids), {})
+        self.assertEqual(SUBMISSIONS.queries, 0)
+
+    def test_bulk_completion_of_the_block_usage_keys(self):
+        course_key = CourseKey.from_string(STUDENT_ITEM["course_id"])
+        usage_key = course_key.make_usage_key("surveymonkey", STUDENT_ITEM["item_id"])
+
+        self.assertEqual(
+            SurveyMonkeyXBlock.bulk_completion(course_key, [usage_key], self.student_ids),
+            {STUDENT_ITEM["item_id"]: {"student-0", "student-3"}},
+        )
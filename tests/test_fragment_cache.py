@@ -0,0 +1,71 @@
+"""
+Tests of the cache keys of the student view fragments.
+"""
+import unittest
+from unittest import mock
+
+from django.utils import translation
+
+from surveymonkey.fragment_cache import get_fragment_cache_key, get_settings_hash
+from surveymonkey.surveymonkey import STUDENT_VIEW_CSS, STUDENT_VIEW_JS, STUDENT_VIEW_TEMPLATE
+
+ASSET_PATHS = (STUDENT_VIEW_TEMPLATE, STUDENT_VIEW_CSS, STUDENT_VIEW_JS)
+SETTINGS = {"survey_id": "100000", "trackable": True, "display_name": "Survey"}
+USAGE_KEY = "block-v1:edX+Test+2021+type@surveymonkey+block@survey"
+
+
+class SettingsHashTest(unittest.TestCase):
+
+    def test_hash_does_not_depend_on_the_settings_order(self):
+        reversed_settings = dict(reversed(list(SETTINGS.items())))
+
+        self.assertEqual(get_settings_hash(SETTINGS, ASSET_PATHS), get_settings_hash(reversed_settings, ASSET_PATHS))
+
+    def test_hash_changes_with_the_settings(self):
+        self.assertNotEqual(
+            get_settings_hash(SETTINGS, ASSET_PATHS),
+            get_settings_hash(dict(SETTINGS, survey_id="100001"), ASSET_PATHS),
+        )
+
+    def test_hash_changes_with_the_assets(self):
+        settings_hash = get_settings_hash(SETTINGS, ASSET_PATHS)
+
+        with mock.patch("surveymonkey.fragment_cache.get_resource_hash", return_value="upgraded"):
+            self.assertNotEqual(get_settings_hash(SETTINGS, ASSET_PATHS), settings_hash)
+
+
+class FragmentCacheKeyTest(unittest.TestCase):
+
+    def setUp(self):
+        super(FragmentCacheKeyTest, self).setUp()
+        self.settings_hash = get_settings_hash(SETTINGS, ASSET_PATHS)
+
+    def get_key(self, **kwargs):
+        key_kwargs = {"usage_key": USAGE_KEY, "settings_hash": self.settings_hash, "completed": False}
+        key_kwargs.update(kwargs)
+
+        with translation.override(key_kwargs.pop("language", "en")):
+            return get_fragment_cache_key(**key_kwargs)
+
+    def test_key_is_stable(self):
+        self.assertEqual(self.get_key(uid="student-0"), self.get_key(uid="student-0"))
+
+    def test_key_depends_on_the_fragment_data(self):
+        keys = {
+            self.get_key(),
+            self.get_key(usage_key="{}-2".format(USAGE_KEY)),
+            self.get_key(settings_hash=get_settings_hash(dict(SETTINGS, trackable=False), ASSET_PATHS)),
+            self.get_key(completed=True),
+            self.get_key(uid="student-0"),
+            self.get_key(uid="student-1"),
+            self.get_key(language="es"),
+        }
+
+        self.assertEqual(len(keys), 7)
+
+    def test_key_is_a_short_cache_key(self):
+        key = self.get_key(uid="student-0" * 50)
+
+        self.assertTrue(key.startswith("surveymonkey_fragment-"))
+        self.assertLess(len(key), 250)
+        self.assertNotIn(" ", key)
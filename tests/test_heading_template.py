@@ -0,0 +1,43 @@
+"""
+Tests of the templates of the overwritten question headings.
+"""
+import unittest
+
+from surveymonkey.heading_template import compile_headings, render_headings
+
+ANSWERS = {
+    "Question 0": "Yes",
+    "Question|1": "Piped",
+}
+
+
+class HeadingTemplateTest(unittest.TestCase):
+
+    def test_placeholders_are_replaced_by_the_answers(self):
+        self.assertEqual(render_headings("You answered {Question 0}", ANSWERS), ["You answered Yes"])
+
+    def test_placeholders_without_answer_are_left_as_written(self):
+        self.assertEqual(render_headings("You answered {Question 2}", ANSWERS), ["You answered {Question 2}"])
+
+    def test_default_is_used_without_answer(self):
+        self.assertEqual(
+            render_headings("{Question 0|nothing} and {Question 2|nothing}", ANSWERS),
+            ["Yes and nothing"],
+        )
+
+    def test_headings_containing_the_separator_are_matched(self):
+        self.assertEqual(render_headings("{Question|1}", ANSWERS), ["Piped"])
+
+    def test_double_braces_are_literal(self):
+        self.assertEqual(render_headings("{{Question 0}} is {Question 0}", ANSWERS), ["{Question 0} is Yes"])
+
+    def test_every_non_blank_line_is_a_heading(self):
+        self.assertEqual(
+            render_headings("First {Question 0}\n\nSecond", ANSWERS),
+            ["First Yes", "Second"],
+        )
+
+    def test_templates_are_compiled_once(self):
+        text = "Compiled {Question 0}"
+
+        self.assertIs(compile_headings(text), compile_headings(text))
@@ -0,0 +1,64 @@
+"""
+Tests of the overwritten question headings, which are only sent to SurveyMonkey when they change.
+"""
+from fake_surveymonkey import QUESTIONS_PER_SURVEY, SURVEY_ID
+
+from tests.base import FakeApiTestCase
+
+CURRENT_HEADINGS = ["Question {}".format(index) for index in range(QUESTIONS_PER_SURVEY)]
+
+
+class OverwriteQuestionHeadingsTest(FakeApiTestCase):
+
+    def setUp(self):
+        super(OverwriteQuestionHeadingsTest, self).setUp()
+        self.api = self.build_api()
+
+    def test_current_headings_are_not_patched(self):
+        self.api.overwrite_question_headings(SURVEY_ID, CURRENT_HEADINGS)
+
+        self.assertEqual(self.server.requests["patch_question"], 0)
+
+    def test_only_the_changed_headings_are_patched(self):
+        headings = list(CURRENT_HEADINGS)
+        headings[1] = "Your previous answer was Yes"
+        headings[4] = "Your previous answer was No"
+
+        self.api.overwrite_question_headings(SURVEY_ID, headings)
+
+        self.assertEqual(self.server.requests["patch_question"], 2)
+
+    def test_patched_headings_are_not_patched_again(self):
+        headings = ["Your previous answer was Yes"] * QUESTIONS_PER_SURVEY
+        self.api.overwrite_question_headings(SURVEY_ID, headings)
+        self.server.requests.clear()
+
+        # The cached survey details still have the previous headings.
+        self.api.overwrite_question_headings(SURVEY_ID, headings)
+        self.assertEqual(self.server.requests["patch_question"], 0)
+
+        self.api.overwrite_question_headings(SURVEY_ID, CURRENT_HEADINGS)
+        self.assertEqual(self.server.requests["patch_question"], QUESTIONS_PER_SURVEY)
+
+    def test_failed_patches_are_sent_again(self):
+        headings = ["Your previous answer was Yes"] + CURRENT_HEADINGS[1:]
+        self.data.failing_pages.add(("patch_question", 1))
+        self.api.overwrite_question_headings(SURVEY_ID, headings)
+        self.data.failing_pages.clear()
+        self.server.requests.clear()
+
+        self.api.overwrite_question_headings(SURVEY_ID, headings)
+
+        self.assertEqual(self.server.requests["patch_question"], 1)
+
+    def test_changed_headings_of_the_survey_questions(self):
+        questions = [
+            {"id": "1", "headings": [{"heading": "Same"}]},
+            {"id": "2", "headings": [{"heading": "Before"}]},
+            {"id": "3", "headings": []},
+        ]
+
+        self.assertEqual(
+            self.api._get_changed_question_headings(SURVEY_ID, questions, ["Same", "After", "New", "Extra"]),
+            [("2", "After"), ("3", "New")],
+        )
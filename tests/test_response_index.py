@@ -0,0 +1,116 @@
+"""
+Tests of the response index used to look up the previous survey response of a learner.
+"""
+import threading
+import time
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+from fake_surveymonkey import PREVIOUS_SURVEY_ID, get_student_id
+
+from tests.base import CACHE_DURATION, PER_PAGE, FakeApiTestCase, wait_until
+
+
+class ResponseIndexTest(FakeApiTestCase):
+
+    def test_index_is_built_once(self):
+        api = self.build_api()
+
+        response = api.get_user_survey_response(PREVIOUS_SURVEY_ID, get_student_id(3))
+        requests = self.server.requests["responses"]
+
+        self.assertEqual(response["custom_variables"]["uid"], get_student_id(3))
+        self.assertEqual(requests, self.responses // PER_PAGE)
+        self.assertEqual(
+            api.get_user_survey_response(PREVIOUS_SURVEY_ID, get_student_id(42))["custom_variables"]["uid"],
+            get_student_id(42),
+        )
+        self.assertEqual(self.server.requests["responses"], requests)
+
+    def test_unknown_uid_refreshes_the_index_incrementally(self):
+        api = self.build_api()
+        api.get_user_survey_response(PREVIOUS_SURVEY_ID, get_student_id(0))
+        new_response = self.add_response("new-student")
+        requests = self.server.requests["responses"]
+
+        with mock.patch("surveymonkey.api_surveymonkey.RESPONSE_INDEX_REFRESH_INTERVAL", 0):
+            response = api.get_user_survey_response(PREVIOUS_SURVEY_ID, "new-student")
+
+        self.assertEqual(response["id"], new_response["id"])
+        self.assertEqual(self.server.requests["responses"], requests + 1)
+
+    def test_unknown_uid_is_not_refreshed_before_the_refresh_interval(self):
+        api = self.build_api()
+        api.get_user_survey_response(PREVIOUS_SURVEY_ID, get_student_id(0))
+        requests = self.server.requests["responses"]
+
+        self.assertEqual(api.get_user_survey_response(PREVIOUS_SURVEY_ID, "new-student"), {})
+        self.assertEqual(self.server.requests["responses"], requests)
+
+    def test_index_is_built_again_when_its_entries_expire(self):
+        api = self.build_api(cache_duration=2)
+        api.get_user_survey_response(PREVIOUS_SURVEY_ID, get_student_id(0))
+        self.add_response("new-student")
+
+        with mock.patch("surveymonkey.api_surveymonkey.RESPONSE_INDEX_REFRESH_INTERVAL", 0):
+            # The incremental refresh does not extend the index past the entries of the build.
+            api.get_user_survey_response(PREVIOUS_SURVEY_ID, "new-student")
+
+        time.sleep(2.5)
+        response = api.get_user_survey_response(PREVIOUS_SURVEY_ID, get_student_id(3))
+
+        self.assertEqual(response["custom_variables"]["uid"], get_student_id(3))
+
+    def test_lookup_waits_for_the_index_built_by_another_worker(self):
+        api = self.build_api()
+        lock_key = "{}-lock".format(api._get_response_index_key(PREVIOUS_SURVEY_ID))
+        cache.add(lock_key, True)
+
+        def build_index():
+            cache.delete(lock_key)
+            api.refresh_response_index(PREVIOUS_SURVEY_ID)
+
+        timer = threading.Timer(0.3, build_index)
+        timer.start()
+        response = api.get_user_survey_response(PREVIOUS_SURVEY_ID, get_student_id(3))
+        timer.join()
+
+        self.assertEqual(response["custom_variables"]["uid"], get_student_id(3))
+        self.assertEqual(self.server.requests["responses"], self.responses // PER_PAGE)
+
+    def test_lookup_does_not_scan_the_responses_if_the_index_is_not_built_in_time(self):
+        api = self.build_api()
+        cache.add("{}-lock".format(api._get_response_index_key(PREVIOUS_SURVEY_ID)), True)
+
+        with mock.patch("surveymonkey.api_surveymonkey.CACHE_FILL_WAIT", 0.2):
+            response = api.get_user_survey_response(PREVIOUS_SURVEY_ID, get_student_id(3))
+
+        self.assertEqual(response, {})
+        self.assertEqual(self.server.requests["responses"], 0)
+
+    def test_index_is_rebuilt_in_the_background_after_its_soft_expiry(self):
+        api = self.build_api()
+        index_key = api._get_response_index_key(PREVIOUS_SURVEY_ID)
+        api.get_user_survey_response(PREVIOUS_SURVEY_ID, get_student_id(0))
+        index_data = cache.get(index_key)
+        index_data["built_at"] -= CACHE_DURATION * 0.9
+        cache.set(index_key, index_data, CACHE_DURATION)
+        requests = self.server.requests["responses"]
+
+        response = api.get_user_survey_response(PREVIOUS_SURVEY_ID, get_student_id(3))
+
+        self.assertEqual(response["custom_variables"]["uid"], get_student_id(3))
+        self.assertTrue(wait_until(lambda: cache.get(index_key)["built_at"] > index_data["built_at"] + 1))
+        self.assertEqual(self.server.requests["responses"], requests + self.responses // PER_PAGE)
+
+    def test_failed_build_does_not_store_the_index(self):
+        with override_settings(SURVEYMONKEY_MAX_RETRIES=0):
+            api = self.build_api()
+
+        self.data.failing_pages.add(("responses", 3))
+
+        self.assertFalse(api.refresh_response_index(PREVIOUS_SURVEY_ID))
+
+        self.assertIsNone(cache.get(api._get_response_index_key(PREVIOUS_SURVEY_ID)))
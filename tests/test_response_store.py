@@ -0,0 +1,93 @@
+"""
+Tests of the SQLite store of the previous survey responses.
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+from fake_surveymonkey import PREVIOUS_SURVEY_ID, get_student_id
+from run_benchmarks import build_block
+
+from surveymonkey.response_store import ResponseStore
+from tests.base import PER_PAGE, FakeApiTestCase
+
+
+class ResponseStoreTest(FakeApiTestCase):
+
+    def setUp(self):
+        super(ResponseStoreTest, self).setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.store = ResponseStore(os.path.join(directory, "responses.sqlite3"))
+
+        with override_settings(SURVEYMONKEY_MAX_RETRIES=0):
+            self.api = self.build_api()
+
+    def test_answers_are_stored_after_a_complete_sync(self):
+        self.assertIsNone(self.store.get_user_answers(PREVIOUS_SURVEY_ID, get_student_id(3)))
+        self.assertTrue(self.store.sync(self.api, PREVIOUS_SURVEY_ID))
+
+        answers = self.store.get_user_answers(PREVIOUS_SURVEY_ID, get_student_id(3))
+
+        self.assertEqual(len(answers), len(self.data.questions))
+        self.assertEqual(answers[0]["question_heading"], "Question 0")
+
+    def test_sync_state_is_not_recorded_after_a_failed_sync(self):
+        self.data.failing_pages.add(("responses", 3))
+
+        self.assertFalse(self.store.sync(self.api, PREVIOUS_SURVEY_ID))
+        self.assertIsNone(self.store.get_sync_state(PREVIOUS_SURVEY_ID))
+
+        self.data.failing_pages.clear()
+
+        self.assertTrue(self.store.sync(self.api, PREVIOUS_SURVEY_ID))
+        self.assertEqual(
+            len(self.store.get_user_answers(PREVIOUS_SURVEY_ID, get_student_id(self.responses - 1))),
+            len(self.data.questions),
+        )
+
+    def test_sync_waits_for_the_first_sync_of_another_worker(self):
+        lock_key = self.store._get_lock_key(PREVIOUS_SURVEY_ID)
+        cache.add(lock_key, True)
+
+        def first_sync():
+            cache.delete(lock_key)
+            self.store.sync(self.api, PREVIOUS_SURVEY_ID)
+
+        timer = threading.Timer(0.3, first_sync)
+        timer.start()
+        synced = self.store.sync(self.api, PREVIOUS_SURVEY_ID)
+        timer.join()
+
+        self.assertTrue(synced)
+        self.assertEqual(self.server.requests["responses"], self.responses // PER_PAGE)
+
+    def test_sync_does_not_crawl_while_another_worker_syncs(self):
+        cache.add(self.store._get_lock_key(PREVIOUS_SURVEY_ID), True)
+
+        with mock.patch("surveymonkey.response_store.CACHE_FILL_WAIT", 0.2):
+            self.assertFalse(self.store.sync(self.api, PREVIOUS_SURVEY_ID))
+
+        self.assertEqual(self.server.requests["responses"], 0)
+
+    def test_sync_is_not_locked_by_the_stores_of_other_hosts(self):
+        other_store = ResponseStore(self.store.path + "-other-host")
+        cache.add(other_store._get_lock_key(PREVIOUS_SURVEY_ID), True)
+
+        self.assertTrue(self.store.sync(self.api, PREVIOUS_SURVEY_ID))
+        self.assertIsNotNone(self.store.get_user_answers(PREVIOUS_SURVEY_ID, get_student_id(3)))
+
+    def test_block_uses_the_response_index_while_the_store_is_not_synced(self):
+        block = build_block(3)
+
+        with override_settings(SURVEYMONKEY_RESPONSE_STORE_PATH=self.store.path), \
+                mock.patch.object(ResponseStore, "sync", return_value=False):
+            previous_data = block.get_user_previous_survey_responses()
+
+        self.assertEqual(len(previous_data), len(self.data.questions))
+        self.assertEqual(previous_data[0]["question_heading"], "Question 0")
@@ -0,0 +1,65 @@
+"""
+Tests of the cached SurveyMonkey values refreshed in the background after their soft expiry.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from fake_surveymonkey import SURVEY_ID
+
+from surveymonkey.api_surveymonkey import build_cache_entry, get_cache_key
+from tests.base import CACHE_DURATION, CLIENT_ID, FakeApiTestCase, wait_until
+
+
+class StaleWhileRevalidateTest(FakeApiTestCase):
+
+    def soft_expire(self, cache_key):
+        cache_entry = cache.get(cache_key)
+        cache_entry["soft_expires_at"] = time.time() - 1
+        cache.set(cache_key, cache_entry, CACHE_DURATION)
+
+    def test_cached_value_is_not_requested_again(self):
+        api = self.build_api()
+        surveys = api.get_surveys()
+        requests = self.server.requests["surveys"]
+
+        self.assertEqual(surveys["total"], self.surveys)
+        self.assertEqual(api.get_surveys(), surveys)
+        self.assertEqual(self.server.requests["surveys"], requests)
+
+    def test_stale_value_is_returned_while_it_is_refreshed(self):
+        api = self.build_api()
+        cache_key = get_cache_key("all_surveys", CLIENT_ID)
+        api.get_surveys()
+        self.data.surveys[0]["title"] = "Renamed survey"
+        self.soft_expire(cache_key)
+
+        self.assertEqual([survey["id"] for survey in api.get_surveys_by_title("Survey 0")], [self.data.surveys[0]["id"]])
+        self.assertEqual(api.get_surveys_by_title("Renamed survey"), [])
+        self.assertTrue(wait_until(lambda: api.get_surveys_by_title("Renamed survey")))
+
+    def test_missing_value_waits_for_the_worker_filling_it(self):
+        api = self.build_api()
+        cache_key = get_cache_key("survey_details", CLIENT_ID, SURVEY_ID)
+        lock_key = "{}-lock".format(cache_key)
+        details = self.data.get_details(SURVEY_ID)
+        cache.add(lock_key, True)
+
+        def fill_cache():
+            cache.set(cache_key, build_cache_entry(details, CACHE_DURATION), CACHE_DURATION)
+            cache.delete(lock_key)
+
+        timer = threading.Timer(0.3, fill_cache)
+        timer.start()
+        value = api.get_survey_details(SURVEY_ID)
+        timer.join()
+
+        self.assertEqual(value, details)
+        self.assertEqual(self.server.requests["details"], 0)
+
+    def test_values_are_not_cached_without_cache_duration(self):
+        api = self.build_api(cache_duration=0)
+        api.get_survey_details(SURVEY_ID)
+        api.get_survey_details(SURVEY_ID)
+
+        self.assertEqual(self.server.requests["details"], 2)
@@ -0,0 +1,107 @@
+"""
+Tests of the SurveyMonkey webhook handler and events.
+"""
+from unittest import mock
+
+from fake_surveymonkey import SURVEY_ID
+from run_benchmarks import build_block
+from webob import Request
+
+from surveymonkey.webhooks import WEBHOOK_RETRY_DELAYS, process_webhook_event, verify_webhook_signature
+from tests.base import FakeApiTestCase
+
+CLIENT_ID = "benchmark-client"
+CLIENT_SECRET = "benchmark-secret"
+BODY = (
+    b'{"event_id": "10", "event_type": "response_completed", "object_id": "400003", '
+    b'"resources": {"survey_id": "100000"}}'
+)
+# Base64 of the HMAC-SHA1 of BODY with the key "benchmark-client&benchmark-secret".
+SIGNATURE = "ZVCSXFW6P6ZaCxJZ2Pi7e33/e2Q="
+INVALID_JSON_BODY = b"not json"
+INVALID_JSON_SIGNATURE = "eWHROl15MBo27QdIBJseP6DEwOI="
+STUDENT_ITEM_BASE = {"course_id": "course-v1:edX+Test+2021", "item_id": "surveymonkey-block"}
+
+
+class VerifyWebhookSignatureTest(FakeApiTestCase):
+
+    def test_signature_of_the_body(self):
+        self.assertTrue(verify_webhook_signature(BODY, SIGNATURE, CLIENT_ID, CLIENT_SECRET))
+
+    def test_signature_of_another_body(self):
+        self.assertFalse(verify_webhook_signature(BODY + b" ", SIGNATURE, CLIENT_ID, CLIENT_SECRET))
+
+    def test_signature_of_another_app(self):
+        self.assertFalse(verify_webhook_signature(BODY, SIGNATURE, CLIENT_ID, "other-secret"))
+
+    def test_missing_signature_or_credentials(self):
+        self.assertFalse(verify_webhook_signature(BODY, None, CLIENT_ID, CLIENT_SECRET))
+        self.assertFalse(verify_webhook_signature(BODY, SIGNATURE, CLIENT_ID, None))
+
+
+class WebhookHandlerTest(FakeApiTestCase):
+
+    def setUp(self):
+        super(WebhookHandlerTest, self).setUp()
+        patcher = mock.patch("surveymonkey.surveymonkey.get_job_queue")
+        self.get_job_queue = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.block = build_block(0)
+
+    def call_webhook(self, body=BODY, signature=SIGNATURE, method="POST"):
+        headers = {"Sm-Signature": signature} if signature else {}
+        return self.block.webhook(Request.blank("/", method=method, body=body, headers=headers))
+
+    def test_head_request_verifies_the_url(self):
+        self.assertEqual(self.call_webhook(body=b"", signature=None, method="HEAD").status_code, 200)
+
+    def test_event_is_enqueued(self):
+        self.assertEqual(self.call_webhook().status_code, 200)
+        self.get_job_queue.return_value.enqueue.assert_called_once()
+
+    def test_invalid_signature_is_rejected(self):
+        self.assertEqual(self.call_webhook(signature=INVALID_JSON_SIGNATURE).status_code, 401)
+        self.assertEqual(self.call_webhook(signature=None).status_code, 401)
+        self.get_job_queue.return_value.enqueue.assert_not_called()
+
+    def test_invalid_body_is_rejected(self):
+        self.assertEqual(self.call_webhook(INVALID_JSON_BODY, INVALID_JSON_SIGNATURE).status_code, 400)
+
+    def test_event_is_retried_by_surveymonkey_when_the_queue_is_full(self):
+        self.get_job_queue.return_value.enqueue.return_value = False
+
+        self.assertEqual(self.call_webhook().status_code, 503)
+
+
+class ProcessWebhookEventTest(FakeApiTestCase):
+
+    def setUp(self):
+        super(ProcessWebhookEventTest, self).setUp()
+        patcher = mock.patch("surveymonkey.webhooks.threading.Timer")
+        self.timer = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.event = {
+            "event_id": "10",
+            "event_type": "response_completed",
+            "object_id": "400003",
+            "resources": {"survey_id": SURVEY_ID},
+        }
+
+    def test_event_is_retried_when_the_response_is_not_returned(self):
+        # The fake API does not serve the single responses.
+        process_webhook_event(self.build_api(), self.event, STUDENT_ITEM_BASE, SURVEY_ID)
+
+        self.assertEqual(self.timer.call_args[0][0], WEBHOOK_RETRY_DELAYS[0])
+        self.timer.return_value.start.assert_called_once()
+
+    def test_event_is_logged_as_lost_after_the_last_attempt(self):
+        with self.assertLogs("surveymonkey.webhooks", "ERROR"):
+            process_webhook_event(
+                self.build_api(),
+                self.event,
+                STUDENT_ITEM_BASE,
+                SURVEY_ID,
+                attempt=len(WEBHOOK_RETRY_DELAYS),
+            )
+
+        self.timer.assert_not_called()